@@ -0,0 +1,100 @@
+import io
+import os
+import time
+from collections import namedtuple, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from reader import FILETYPES, filetype, sheetnames, scan, sample, iter_chunks
+from vcard import compile_assign
+from parallel import WorkerPool, render
+from photo import Photos, iter_photos
+from profiles import headerkey, headersignature
+from shard import shardlabel
+from utils import automap, build_assign, mappedcolumns
+
+# Batch conversion: every input file, and with all_sheets every sheet of a workbook, is
+# one job. Jobs go through a bounded queue of spawned worker processes (at most
+# `workers` running and as many waiting, so uploads are not all copied to the workers
+# at once), each job streams its cards into its own output file, and every job is
+# reported with its rows and seconds as soon as it finishes. A failing job is reported
+# and does not stop the others.
+
+Job = namedtuple("Job", ["name", "source", "sheet"])  # source: a path, or the bytes of an upload
+
+def jobfile(job):
+    if isinstance(job.source, bytes):
+        return io.BytesIO(job.source)
+    return open(job.source, "rb")
+
+def joblabel(job):
+    return job.name if job.sheet is None else f"{job.name} [{job.sheet}]"
+
+def jobstem(job):
+    # Output name without extension: "contacts", or "book_Sheet1" for a sheet
+    stem = os.path.splitext(os.path.basename(job.name))[0]
+    return stem if job.sheet is None else f"{stem}_{shardlabel(job.sheet)}"
+
+def filejobs(name, source, all_sheets=False):
+    if all_sheets and filetype(name) == "xlsx":
+        with jobfile(Job(name, source, None)) as file:
+            return [Job(name, source, sheet) for sheet in sheetnames(file)]
+    return [Job(name, source, None)]
+
+def expand(paths, all_sheets=False):
+    # Directories stand for the spreadsheets directly inside them (Excel lock files skipped)
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if filetype(name) in FILETYPES and not name.startswith("~$"))
+            files = [os.path.join(path, name) for name in names]
+        else:
+            files = [path]
+        for file in files:
+            jobs.extend(filejobs(file, file, all_sheets))
+    return jobs
+
+def attempt(task, job):
+    start = time.perf_counter()
+    try:
+        rows = task(job)
+    except (Exception, SystemExit) as error:
+        return {"state": "failed", "rows": 0, "seconds": time.perf_counter() - start, "error": str(error) or type(error).__name__}
+    return {"state": "done", "rows": rows, "seconds": time.perf_counter() - start, "error": None}
+
+def run_jobs(jobs, task, workers=1):
+    # Yields (job, status) in the order the jobs finish; task(job) returns the rows written
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield job, attempt(task, job)
+        return
+
+    with WorkerPool(workers) as pool:
+        queue = deque(jobs)
+        running = {}
+        while queue or running:
+            while queue and len(running) < workers * 2:  # Bound the jobs in flight
+                job = queue.popleft()
+                running[pool.submit(attempt, task, job)] = job
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), pool.result(future)
+
+def convert_job(job, directory, mappings, constants=(), version="3.0", country_code=None, spec=False, rev=None):
+    # The app's batch task. mappings: header signature -> {headerkey(column): field}; columns it
+    # does not name are auto-detected. The cards go to directory/<jobstem>.vcf.
+    extension = filetype(job.name)
+    with jobfile(job) as file:
+        layout = {}
+        columns, _ = scan(file, extension, stats=layout, sheet=job.sheet)
+        mapping = automap(columns, sample(file, extension, columns, sheet=job.sheet))
+        known = mappings.get(headersignature(columns), {})
+        mapping.update({column: known[headerkey(column)] for column in columns if headerkey(column) in known})
+        assign = build_assign(columns, mapping, constants)
+        usecols = mappedcolumns(columns, assign) or None
+        plan = compile_assign(assign, usecols or columns, country_code, spec=spec)
+        rows = 0
+        with open(os.path.join(directory, jobstem(job) + ".vcf"), "wb") as out:
+            chunks = iter_chunks(file, extension, columns, text=usecols or columns, sheet=job.sheet, usecols=usecols, blank=layout.get("blank"))
+            for chunk in iter_photos(chunks, plan, Photos(local=False)):  # Uploads bring no photos: Photo columns stay empty
+                out.write(render(chunk, plan, version, rev))
+                rows += len(chunk)
+    return rows
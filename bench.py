@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+
+# Benchmarks for the ingest -> map -> generate pipeline. Every size runs in its own
+# process so the reported peak RSS belongs to that size alone.
+#
+#   python bench.py run --rows 1000 100000 1000000 -o new.json
+#   python bench.py compare base.json new.json --threshold 0.1
+
+FIRST = ["Aarav", "Ananya", "Zoë", "José", "Łukasz", "Siobhán", "王芳", "Анна", "Mary Ann", "O'Neil"]
+LAST = ["Sharma", "Müller", "García", "Nguyễn", "Smith", "Kowalski", "Σωκράτης", "Ivanova", "van der Berg", "Lee"]
+PHONE_FORMATS = ["+91 {a} {b}", "0{a}-{b}", "({a}) {b}", "{a}{b}", "{a}.{b}"]
+
+def synthetic(rows, phones=2, emails=2, extra=3, missing=0.1, seed=0):
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    data = {
+        "First Name": rng.choice(FIRST, rows),
+        "Last Name": rng.choice(LAST, rows),
+        "Organization": rng.choice(["IIT KGP", "ACME, Inc.", "Globex", "Initech"], rows),
+        "Job Title": rng.choice(["Engineer", "Manager", "Professor", "Student"], rows),
+        "Address": rng.choice(["12 Main St; Springfield", "Hall 4, Kharagpur", "221B Baker Street"], rows),
+    }
+    for i in range(phones):
+        a = rng.integers(10000, 99999, rows).astype(str)
+        b = rng.integers(10000, 99999, rows).astype(str)
+        fmt = rng.choice(PHONE_FORMATS, rows)
+        data[f"Phone {i + 1}"] = [f.format(a=x, b=y) for f, x, y in zip(fmt, a, b)]
+    for i in range(emails):
+        user = rng.integers(0, 10 ** 6, rows).astype(str)
+        data[f"Email {i + 1}"] = [f"user{u}@example{i}.com" for u in user]
+    for i in range(extra):
+        data[f"Extra {i + 1}"] = rng.integers(0, 10 ** 9, rows).astype(str)
+    df = pd.DataFrame(data)
+    if missing:
+        df = df.mask(rng.random(df.shape) < missing)
+    return df
+
+def peakrss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 if sys.platform != "darwin" else peak / 1024 / 1024, 1)  # MiB
+
+def runsize(args):
+    from reader import filetype, scan, iter_chunks
+    from vcard import compile_assign, gen_vcard
+    from parallel import iter_parallel
+    from utils import automap, build_assign, mappedcolumns
+
+    path = args.path
+    stages = {}
+
+    def record(name, seconds, count):
+        stages[name] = {"seconds": round(seconds, 4), "rows_per_sec": round(count / seconds, 1) if seconds else None, "peak_rss_mb": peakrss()}
+
+    with open(path, "rb") as file:
+        extension = filetype(path)
+        start = time.perf_counter()
+        layout = {}
+        columns, total_rows = scan(file, extension, stats=layout)
+        record("scan", time.perf_counter() - start, total_rows)
+
+        start = time.perf_counter()
+        assign = build_assign(columns, automap(columns))
+        usecols = mappedcolumns(columns, assign) or None  # Loaded as the app and the CLI load them: mapped columns only, as text
+        plan = compile_assign(assign, usecols or columns)
+        record("map", time.perf_counter() - start, total_rows)
+
+        start = time.perf_counter()
+        chunks = list(iter_chunks(file, extension, columns, text=usecols or columns, usecols=usecols, blank=layout.get("blank")))
+        record("parse", time.perf_counter() - start, total_rows)
+
+    start = time.perf_counter()
+    size = 0
+    for _, text in iter_parallel(chunks, plan, version="3.0", workers=args.workers, total_rows=total_rows, rev="20000101T000000Z"):
+        size += len(text)
+    record("generate", time.perf_counter() - start, total_rows)
+
+    if total_rows <= args.row_path_limit:
+        start = time.perf_counter()
+        for chunk in chunks:
+            for _, row in chunk.iterrows():
+                gen_vcard(plan, row, "3.0", "20000101T000000Z")
+        record("generate_rows", time.perf_counter() - start, total_rows)
+    return {"rows": total_rows, "bytes": size, "stages": stages}
+
+def run(args):
+    results = {"python": sys.version.split()[0], "format": args.format, "sizes": {}}
+    script = os.path.abspath(__file__)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in args.rows:
+            path = os.path.join(tmpdir, f"bench_{size}.{args.format}")
+            df = synthetic(size, args.phones, args.emails, args.extra, args.missing, args.seed)
+            if args.format == "xlsx":
+                df.to_excel(path, index=False)
+            else:
+                df.to_csv(path, index=False, sep="\t" if args.format == "tsv" else ",")
+            del df
+            command = [sys.executable, script, "_size", path, "--row-path-limit", str(args.row_path_limit)]
+            if args.workers:
+                command += ["--workers", str(args.workers)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.path.dirname(script)).stdout
+            result = json.loads(output)
+            results["sizes"][str(size)] = result
+            os.remove(path)
+            for name, stage in result["stages"].items():
+                print(f"{size:>9} rows  {name:<14} {stage['seconds']:>9.3f}s  {stage['rows_per_sec'] or 0:>12,.0f} rows/s  peak {stage['peak_rss_mb']} MiB")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+def compare(args):
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    failed = False
+    for size, result in new["sizes"].items():
+        if size not in base["sizes"]:
+            continue
+        for name, stage in result["stages"].items():
+            old = base["sizes"][size]["stages"].get(name)
+            if not old or not old["rows_per_sec"] or not stage["rows_per_sec"]:
+                continue
+            if max(old["seconds"], stage["seconds"]) < args.min_seconds:
+                continue  # Too short to time reliably
+            change = stage["rows_per_sec"] / old["rows_per_sec"] - 1
+            slower = change < -args.threshold
+            failed = failed or slower
+            print(f"{size:>9} rows  {name:<14} {old['rows_per_sec']:>12,.0f} -> {stage['rows_per_sec']:>12,.0f} rows/s  {change:+.1%}{'  REGRESSION' if slower else ''}")
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench.py", description="Benchmark parsing, mapping and vCard generation on synthetic contacts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("run", help="run the benchmarks")
+    command.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    command.add_argument("-o", "--output", help="write the results as JSON")
+    command.add_argument("--format", default="csv", choices=["csv", "tsv", "xlsx"])
+    command.add_argument("--phones", type=int, default=2, help="phone columns per contact")
+    command.add_argument("--emails", type=int, default=2, help="email columns per contact")
+    command.add_argument("--extra", type=int, default=3, help="unmapped noise columns")
+    command.add_argument("--missing", type=float, default=0.1, help="fraction of empty cells")
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--workers", type=int, help="worker processes for generation (default: available CPUs)")
+    command.add_argument("--row-path-limit", type=int, default=10000, help="also time gen_vcard per row up to this many rows")
+
+    command = commands.add_parser("compare", help="compare two result files")
+    command.add_argument("base")
+    command.add_argument("new")
+    command.add_argument("--threshold", type=float, default=0.1, help="allowed rows/sec drop before failing (default 0.1 = 10%%)")
+    command.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this in both runs")
+
+    command = commands.add_parser("_size")  # internal: one input file in a fresh process
+    command.add_argument("path")
+    command.add_argument("--workers", type=int)
+    command.add_argument("--row-path-limit", type=int, default=10000)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    if args.command == "compare":
+        return compare(args)
+    json.dump(runsize(args), sys.stdout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "vcf-cache")
+MAX_OUTPUT_BYTES = 512 * 1024 * 1024
+
+_lock = threading.Lock()
+_outputs = OrderedDict()  # key -> (path, size), least recently used first
+
+def contenthash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def outputkey(filehash, assign, version, **options):
+    payload = json.dumps([filehash, list(assign.items()), str(version), sorted(options.items())], default=str)
+    return contenthash(payload.encode("utf-8"))
+
+def outputfile(suffix=".vcf"):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(suffix=suffix, dir=CACHE_DIR, delete=False)
+
+def cached_output(key):
+    with _lock:
+        if key not in _outputs:
+            return None
+        path, size = _outputs[key]
+        if not os.path.exists(path):
+            del _outputs[key]
+            return None
+        _outputs.move_to_end(key)
+        return path
+
+def store_output(key, path):
+    size = os.path.getsize(path)
+    with _lock:
+        if key in _outputs:
+            old, _ = _outputs.pop(key)
+            if old != path and os.path.exists(old):
+                os.remove(old)
+        _outputs[key] = (path, size)
+        total = sum(size for _, size in _outputs.values())
+        while total > MAX_OUTPUT_BYTES and len(_outputs) > 1:
+            _, (old, oldsize) = _outputs.popitem(last=False)
+            total -= oldsize
+            if os.path.exists(old):
+                os.remove(old)
+    return path
+
+def touch(path):
+    # Marks a cache entry (file or directory) as just used: evict() goes by modification time
+    os.utime(path)
+
+def entrysize(entry):
+    if entry.is_dir():
+        return sum(part.stat().st_size for part in os.scandir(entry.path))
+    return entry.stat().st_size
+
+def evict(directory, limit, keep=None):
+    # Removes the least recently used entries of a cache directory until the rest take at
+    # most limit bytes; returns the bytes left. keep is never removed, and entries whose
+    # names start with "." are still being written.
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.name.startswith("."):
+            continue
+        try:
+            size = entrysize(entry)
+            used = entry.stat().st_mtime
+        except FileNotFoundError:
+            continue  # Removed by another process
+        total += size
+        if entry.path != keep:
+            entries.append((used, size, entry.path))
+    entries.sort()
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+    return total
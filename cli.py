@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import argparse
+import perf
+
+# Heavy modules (pandas via reader/vcard) are imported inside the functions that need
+# them so `--help` and argument errors return immediately; streamlit is never imported.
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="Convert CSV, TSV or XLSX contact files to vCard without the Streamlit app. .vcf inputs are converted back to a spreadsheet (CSV, TSV or XLSX, picked from the output name).")
+    parser.add_argument("inputs", nargs="+", help="input .csv, .tsv, .xlsx or .vcf files, or directories of .csv, .tsv and .xlsx files")
+    parser.add_argument("-o", "--output", help="output file, '-' for stdout, or a directory when several inputs are given (default: next to each input)")
+    parser.add_argument("--all-sheets", action="store_true", help="convert every sheet of .xlsx inputs, each to its own output named after the workbook and sheet (default: the first sheet only)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="convert up to N inputs or sheets at once, each in its own process (default: 1); files are then converted in-process unless -w is given")
+    parser.add_argument("-m", "--mapping", help="JSON file mapping column names to fields, e.g. {\"Mobile\": \"Phone Number+Work\"}; unmapped columns are auto-detected")
+    parser.add_argument("-c", "--const", action="append", default=[], metavar="FIELD=VALUE", help="add a field with the same value to every contact (repeatable)")
+    parser.add_argument("--profile", metavar="NAME", help="use a saved mapping profile (from the app or --save-profile); 'auto' picks the profile saved for the input's set of headers, if any")
+    parser.add_argument("--save-profile", metavar="NAME", help="save the mapping used for the input as a named profile")
+    parser.add_argument("--vcard-version", default="3.0", choices=["2.1", "3.0", "4.0"], help="vCard version to write (2.1 is the iOS setting in the app; 4.0 implies --strict)")
+    parser.add_argument("--strict", action="store_true", help="standards-compliant output: escaped values, lines folded at 75 octets, structured N and ADR, quoted-printable for non-ASCII 2.1 values, CRLF line ends")
+    parser.add_argument("--snapshot", action="store_true", help="keep a columnar snapshot of .xlsx inputs in ~/.vcf/snapshots, keyed by content, and read only the mapped columns from it; repeat runs on the same workbook skip parsing it")
+    parser.add_argument("-w", "--workers", type=int, help="worker processes for large files (default: available CPUs)")
+    parser.add_argument("--country-code", help="write phone numbers in E.164 form, using this calling code (e.g. 91) for numbers without one")
+    parser.add_argument("--incremental", metavar="DIR", help="only write new or changed contacts; per-input index files and lists of removed UIDs are kept in DIR")
+    parser.add_argument("--dedup", action="store_true", help="merge contacts that share a phone number or email address into one card (reads each input twice)")
+    parser.add_argument("--max-contacts", type=int, metavar="N", help="split the output into a ZIP of .vcf files with at most N contacts each")
+    parser.add_argument("--max-size", metavar="SIZE", help="split the output into a ZIP of .vcf files of at most SIZE each, e.g. 5M")
+    parser.add_argument("--group-by", metavar="COLUMN", help="write a separate series of .vcf files into the ZIP for each value of COLUMN, e.g. Organization")
+    parser.add_argument("--photos", metavar="PATH", help="folder or ZIP archive holding the images named in a Photo column (default: paths are relative to the input's folder)")
+    parser.add_argument("--photo-size", type=int, default=256, metavar="PX", help="longest side of embedded photos in pixels; needs Pillow, without it images are embedded unchanged (default: 256)")
+    parser.add_argument("--report", nargs="?", const="csv", choices=["csv", "json"], help="write a data-quality report (empty names, phone numbers without digits, malformed emails) next to each output as NAME.report.csv or .json")
+    parser.add_argument("--skip-invalid", action="store_true", help="leave rows with data-quality issues out of the output")
+    parser.add_argument("--quarantine", action="store_true", help="leave rows with data-quality issues out and write them to NAME.invalid.csv next to the output")
+    parser.add_argument("--key", action="append", metavar="COLUMN", help="column(s) identifying a contact in --incremental mode (default: the name columns)")
+    parser.add_argument("--rev", help="REV timestamp written to every card, e.g. 20240101T000000Z, for reproducible output (default: time of the run)")
+    parser.add_argument("--progress", action="store_true", default=None, help="show rows/sec and ETA on stderr (default when stderr is a terminal)")
+    parser.add_argument("--no-progress", dest="progress", action="store_false", help="never show progress")
+    parser.add_argument("--perf", metavar="PATH", help="time each stage (reading, cleaning, validation, generation per field, writing) and count rows and bytes, then write the totals as JSON to PATH, '-' for stderr; also enabled by VCF_PERF=1, which prints them to stderr")
+    parser.add_argument("--cprofile", metavar="PATH", help="run under cProfile and save the statistics to PATH for pstats or snakeviz (covers this process only, not -w or -j workers)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log debug messages to stderr")
+    parser.add_argument("--print-mapping", action="store_true", help="print the resolved column mapping as JSON and exit")
+    return parser.parse_args(argv)
+
+def outputpath(args, job, suffix=".vcf", several=False):
+    from batch import jobstem
+    stem = jobstem(job) + suffix
+    if args.output is None:
+        return os.path.join(os.path.dirname(job.source), stem)
+    if several or os.path.isdir(args.output):
+        os.makedirs(args.output, exist_ok=True)
+        return os.path.join(args.output, stem)
+    return args.output
+
+def sharded(args):
+    return bool(args.max_contacts or args.max_size or args.group_by)
+
+def resolve_mapping(columns, mapping, sample=None):
+    from utils import automap
+    resolved = automap(columns, sample)
+    byname = {str(column): column for column in columns}
+    resolved.update({byname[column]: field for column, field in mapping.items() if column in byname})
+    return resolved
+
+def apply_profile(args, columns, mapping, constants):
+    # A profile maps every column it knows; its unmapped columns stay unmapped instead of
+    # being auto-detected. -m and -c still apply on top of it.
+    if not args.profile:
+        return mapping, constants
+    from profiles import load_profiles, find_profile, headerkey, profile_mapping
+    name = find_profile(columns) if args.profile == "auto" else args.profile
+    profile = load_profiles().get(name) if name else None
+    if profile is None:
+        if args.profile == "auto":
+            return mapping, constants
+        sys.exit(f"cli.py: no mapping profile named {args.profile!r}")
+    known, saved = profile_mapping(profile)
+    resolved = {str(column): known.get(headerkey(column), "NONE") for column in columns}
+    resolved.update(mapping)
+    return resolved, saved + constants
+
+def convert(job, out, args, mapping, constants, rev, sidecar):
+    # sidecar: output path without extension, for the report and quarantine files
+    from reader import SNAPSHOT, filetype, scan, sample, iter_chunks
+    from vcard import compile_assign
+    from parallel import iter_parallel
+    from utils import build_assign, mappedcolumns
+    from batch import jobfile, joblabel, jobstem
+
+    extension = filetype(job.name)
+    path = joblabel(job)  # For messages
+    with jobfile(job) as file:
+        if args.snapshot and extension == "xlsx":
+            from cache import contenthash
+            from snapshot import open_snapshot
+            with perf.stage("read.snapshot"):
+                snapshot = open_snapshot(file, contenthash(file.read()), job.sheet)
+            if snapshot is not None:
+                file, extension = snapshot, SNAPSHOT
+        layout = {}
+        columns, total_rows = scan(file, extension, stats=layout, sheet=job.sheet)
+        mapping, constants = apply_profile(args, columns, mapping, constants)
+        assign = build_assign(columns, resolve_mapping(columns, mapping, sample(file, extension, columns, sheet=job.sheet)), constants)
+        if args.save_profile:
+            from profiles import save_profile
+            save_profile(args.save_profile, columns, assign)
+        spec = args.strict or args.vcard_version == "4.0"
+        # Second phase: only the mapped, group and key columns are loaded, all of them as
+        # text, so numbers keep the digits of the file instead of going through float
+        usecols = mappedcolumns(columns, assign, [args.group_by] + (args.key or [])) or None
+        generated = list(usecols or columns)  # Columns of the rows handed to the generator
+        if args.dedup:
+            import dedup
+            assign = dedup.with_extra(assign)
+            generated.append(dedup.EXTRA_COLUMN)
+        if args.incremental:
+            import delta
+            stem = os.path.join(args.incremental, jobstem(job))
+            index = delta.load_index(stem + ".index.json")
+            options = {"country_code": args.country_code}
+            if spec:
+                options["strict"] = True  # Only when set, so existing indexes stay valid
+            settings = delta.settingshash(assign, args.vcard_version, **options)
+            assign = delta.with_uid(assign)
+            generated.append(delta.UID_COLUMN)
+        plan = compile_assign(assign, generated, args.country_code, spec=spec)
+        text = usecols or columns
+        read = {}
+        progress = None
+        if args.progress or (args.progress is None and sys.stderr.isatty()):
+            from progress import Progress, stream_display
+            progress = Progress(total_rows, stream_display(sys.stderr, f"{path}: "), interval=1.0)
+        chunks = iter_chunks(file, extension, columns, text=text, stats=read, sheet=job.sheet, usecols=usecols, blank=layout.get("blank"))
+        report = None
+        quarantine = None
+        if args.report or args.skip_invalid or args.quarantine:
+            import validate
+            report = validate.new_report()
+            if args.quarantine:
+                quarantine = open(sidecar + ".invalid.csv", "w", encoding="utf-8", newline="")
+            chunks = perf.iterate("validate", validate.iter_validate(chunks, plan, report, args.skip_invalid, quarantine))
+        if args.dedup:
+            merges = {}
+            first = iter_chunks(file, extension, columns, text=text, sheet=job.sheet, usecols=usecols, blank=layout.get("blank"))
+            if args.skip_invalid or args.quarantine:
+                first = validate.iter_validate(first, plan, skip=True)  # Group the same rows the second pass keeps
+            with perf.stage("dedup.group"):
+                groups = dedup.find_groups(first, plan, stats=merges)
+            chunks = perf.iterate("dedup.merge", dedup.iter_dedup(chunks, plan, groups, stats=merges, version=args.vcard_version))
+        if args.incremental:
+            stats = {}
+            chunks = perf.iterate("delta", delta.iter_delta(chunks, plan, index, settings, key=args.key, stats=stats))
+        photos = None
+        if any(field.kind == "photo" for field in plan.props):
+            from photo import Photos, ThumbnailCache, iter_photos
+            folder = args.photos if args.photos and os.path.isdir(args.photos) else os.path.dirname(os.path.abspath(job.source))
+            photos = Photos(folder, args.photos if args.photos and not os.path.isdir(args.photos) else None, ThumbnailCache(), args.photo_size)
+            pictures = {}
+            chunks = perf.iterate("photos", iter_photos(chunks, plan, photos, stats=pictures))
+        if sharded(args):
+            from functools import partial
+            from parallel import render_cards
+            from shard import ShardWriter, parsesize
+            if args.group_by and args.group_by not in columns:
+                sys.exit(f"cli.py: --group-by column {args.group_by!r} is not in {path}")
+            with ShardWriter(out, jobstem(job), args.max_contacts, args.max_size and parsesize(args.max_size)) as shards:
+                for rows, (cards, groups) in iter_parallel(chunks, plan, version=args.vcard_version, workers=args.workers, total_rows=total_rows, rev=rev, task=partial(render_cards, group=args.group_by)):
+                    with perf.stage("write"):
+                        shards.write(cards, groups)
+                    if perf.enabled():
+                        perf.count("bytes.written", sum(len(card) for card in cards))
+                    if progress:
+                        progress.update(read["rows"])
+            print(f"{path}: {len(shards.shards)} files in the archive", file=sys.stderr)
+        else:
+            for rows, text in iter_parallel(chunks, plan, version=args.vcard_version, workers=args.workers, total_rows=total_rows, rev=rev):
+                with perf.stage("write"):
+                    out.write(text)
+                perf.count("bytes.written", len(text))
+                if progress:
+                    progress.update(read["rows"])
+        if progress:
+            progress.finish()
+    if photos is not None:
+        photos.close()
+        print(f"{path}: {pictures.get('embedded', 0)} photos embedded, {pictures.get('missing', 0)} not found, {pictures.get('unreadable', 0)} not readable as images", file=sys.stderr)
+    if quarantine is not None:
+        quarantine.close()
+    if report is not None:
+        if args.report:
+            validate.write_report(report, f"{sidecar}.report.{args.report}")
+        print(f"{path}: {report['invalid']} of {report['rows']} rows have data-quality issues" + "".join(f", {entry['count']} {issue}" for issue, entry in report["issues"].items() if entry["count"]), file=sys.stderr)
+        if args.skip_invalid or args.quarantine:
+            total_rows -= report["invalid"]
+    if args.dedup:
+        print(f"{path}: merged {merges['merged']} duplicate rows into {merges['groups']} contacts" + (f"; {merges['ignored']} numbers or addresses shared by more than {dedup.MAX_SHARED} rows were not used for merging" if merges["ignored"] else ""), file=sys.stderr)
+        total_rows -= merges["merged"]
+    if args.incremental:
+        delta.save_index(stem + ".index.json", index)
+        with open(stem + ".removed.txt", "w", encoding="utf-8") as removed:
+            removed.writelines(uid + "\n" for uid in stats["removed"])
+        print(f"{path}: {stats['new']} new, {stats['changed']} changed, {stats['unchanged']} unchanged, {len(stats['removed'])} removed (UIDs in {stem}.removed.txt)", file=sys.stderr)
+        return stats["new"] + stats["changed"]
+    return total_rows
+
+def run_job(job, args, mapping, constants, rev, targets):
+    # One batch job: targets maps each job to its output path ("-" for stdout)
+    target = targets[job]
+    if job.name.lower().endswith(".vcf"):
+        return export_vcf(job.source, target)
+    if target == "-":
+        return convert(job, sys.stdout.buffer, args, mapping, constants, rev, os.path.splitext(job.source)[0])
+    with open(target, "wb") as out:
+        return convert(job, out, args, mapping, constants, rev, os.path.splitext(target)[0])
+
+def export_vcf(path, target):
+    import vcfparser
+    extension = os.path.splitext(target)[1].lower()
+    with open(path, "rb") as file:
+        records = vcfparser.iter_records(file)
+        if extension == ".xlsx":
+            return vcfparser.write_xlsx(records, target)
+        if target == "-":
+            return vcfparser.write_csv(records, sys.stdout)
+        with open(target, "w", newline="", encoding="utf-8") as out:
+            return vcfparser.write_csv(records, out, sep="\t" if extension == ".tsv" else ",")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.verbose:
+        import logging
+        logging.basicConfig(level=logging.DEBUG, format="%(name)s: %(message)s")
+    mapping = {}
+    if args.mapping:
+        with open(args.mapping, encoding="utf-8") as file:
+            mapping = json.load(file)
+    constants = []
+    for item in args.const:
+        field, sep, value = item.partition("=")
+        if not sep:
+            sys.exit(f"cli.py: --const expects FIELD=VALUE, got {item!r}")
+        constants.append((field, value))
+
+    import batch
+    jobs = batch.expand(args.inputs, args.all_sheets)
+    if not jobs:
+        sys.exit("cli.py: no .csv, .tsv or .xlsx files in the given directories")
+    if len(jobs) > 1 and args.output == "-":
+        sys.exit("cli.py: -o - only works with a single input")
+
+    if args.print_mapping:
+        from reader import filetype, scan, sample
+        resolved = {}
+        for job in jobs:
+            with batch.jobfile(job) as file:
+                columns, _ = scan(file, filetype(job.name), sheet=job.sheet)
+                known, _ = apply_profile(args, columns, mapping, constants)
+                resolved[batch.joblabel(job)] = resolve_mapping(columns, known, sample(file, filetype(job.name), columns, sheet=job.sheet))
+        json.dump(resolved, sys.stdout, indent=2, default=str)
+        print()
+        return 0
+
+    if args.incremental:
+        os.makedirs(args.incremental, exist_ok=True)
+    if args.max_size:
+        from shard import parsesize
+        try:
+            parsesize(args.max_size)
+        except ValueError as error:
+            sys.exit(f"cli.py: --max-size: {error}")
+    suffix = ".zip" if sharded(args) else ".vcf"
+    targets = {job: outputpath(args, job, ".csv" if job.name.lower().endswith(".vcf") else suffix, len(jobs) > 1) for job in jobs}
+    inputs = {os.path.abspath(job.source) for job in jobs}
+    for target in targets.values():
+        if target != "-" and os.path.abspath(target) in inputs:
+            sys.exit(f"cli.py: refusing to overwrite input file {target}; pass -o")
+    if len(set(targets.values())) < len(targets):
+        sys.exit("cli.py: several inputs would be written to the same output file")
+
+    from functools import partial
+    from utils import revgen
+    rev = args.rev or revgen()
+    if args.jobs > 1:
+        # Parallelism comes from the jobs; per-file workers and progress lines would interleave
+        args.workers = args.workers or 1
+        args.progress = False
+    task = partial(run_job, args=args, mapping=mapping, constants=constants, rev=rev, targets=targets)
+    report = args.perf or ("-" if perf.enabled() else None)
+    if report:
+        perf.enable()
+        perf.reset()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    failed = 0
+    start = time.perf_counter()
+    for job, status in batch.run_jobs(jobs, task, args.jobs):
+        if status["state"] == "failed":
+            failed += 1
+            print(f"{batch.joblabel(job)}: failed after {status['seconds']:.1f}s: {status['error']}", file=sys.stderr)
+        else:
+            perf.count("rows.written", status["rows"])
+            print(f"{batch.joblabel(job)} -> {targets[job]}: {status['rows']} contacts in {status['seconds']:.1f}s", file=sys.stderr)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+    if report:
+        perf.add("total", time.perf_counter() - start, own=0)  # Own time is in the stages
+        perf.write_json(report)
+    if len(jobs) > 1:
+        print(f"{len(jobs) - failed} of {len(jobs)} jobs converted in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import re
+import numpy as np
+import pandas as pd
+from vcard import phonecolumn
+
+# Duplicate merging in two streaming passes. find_groups() collects the normalized phone
+# numbers and lowercased email addresses of every row, factorizes them and joins rows
+# that share one through a union-find over the shared keys only. Placeholder values
+# (too short, one repeated digit, "na@na.com", or shared by more than max_shared rows)
+# never join rows. iter_dedup() then streams the rows again and replaces every group
+# with one merged row: the first non-empty value of each column, plus the group's
+# other numbers and addresses as extra TEL/EMAIL lines in EXTRA_COLUMN. A merged card
+# is emitted where its last row was. Keys are computed once per chunk, rows of open
+# groups are held sorted by the row their group closes at, and every group is merged
+# once, with groupby, in the chunk it closes in.
+
+EXTRA_COLUMN = "vCard extra lines"
+MAX_SHARED = 10  # More rows than this sharing a number or address: a placeholder, not one person
+MIN_PHONE_DIGITS = 7
+PLACEHOLDER_LOCALS = {"na", "n/a", "none", "nil", "null", "no", "noemail", "noreply", "no-reply", "test", "x", "xx", "xxx", "abc", "email", "mail"}
+EMAIL_SHAPE = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+# Keys that can join rows, one regex per kind: a number of MIN_PHONE_DIGITS or more that
+# is not one repeated digit, an address whose local part is not a placeholder
+USABLE = {
+    "tel": rf"\+*(?!\+)(?!(\d)\1*$).{{{MIN_PHONE_DIGITS},}}",
+    "email": "(?!(?:" + "|".join(re.escape(local) for local in sorted(PLACEHOLDER_LOCALS)) + ")@)" + EMAIL_SHAPE,
+}
+
+def with_extra(assign):
+    assign = dict(assign)
+    assign[f"Raw{len(assign) + 1}"] = EXTRA_COLUMN
+    return assign
+
+def keycolumns(chunk, plan):
+    # (field, text, key) per TEL/EMAIL field: the text a card shows and the key rows are joined on, "" when empty
+    for field in plan.props:
+        if field.pos is None or field.kind not in ("tel", "email"):
+            continue
+        col = chunk.iloc[:, field.pos]
+        if field.kind == "tel":
+            text = phonecolumn(col, country_code=plan.country_code)
+            key = text
+        else:
+            text = col.astype(str).str.strip()
+            key = text.str.lower()
+        empty = col.isna()
+        yield field, text.mask(empty, ""), key.mask(empty, "")
+
+def usable(kind, keys):
+    # Mask of keys that can join rows: no placeholders
+    return keys.str.fullmatch(USABLE[kind], na=False)
+
+def find_groups(chunks, plan, max_shared=MAX_SHARED, stats=None):
+    # (roots, sizes): the first row of each row's group, and the group's size; stats: "ignored" shared keys
+    rows = []
+    keys = []
+    start = 0
+    for chunk in chunks:
+        for field, _, key in keycolumns(chunk, plan):
+            keep = usable(field.kind, key).to_numpy()
+            rows.append(np.arange(start, start + len(chunk))[keep])
+            keys.append((field.kind + ":" + key[keep]).to_numpy(dtype=object))
+        start += len(chunk)
+    parent = np.arange(start)
+    if keys:
+        rows = np.concatenate(rows)
+        codes, _ = pd.factorize(np.concatenate(keys))
+        counts = np.bincount(codes) if len(codes) else np.zeros(0, dtype=np.int64)
+        first = np.full(len(counts), start, dtype=np.int64)
+        np.minimum.at(first, codes, rows)
+        shared = counts[codes]
+        joins = (rows != first[codes]) & (shared <= max_shared)
+        if stats is not None:
+            stats["ignored"] = int((counts > max_shared).sum())
+
+        def find(row):
+            root = row
+            while parent[root] != root:
+                root = parent[root]
+            while parent[row] != root:
+                parent[row], row = root, parent[row]
+            return root
+
+        for row, other in zip(rows[joins].tolist(), first[codes[joins]].tolist()):
+            a, b = find(row), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)  # The earliest row stays the root
+        for row in np.flatnonzero(parent != np.arange(start)).tolist():
+            parent[row] = find(row)
+    elif stats is not None:
+        stats["ignored"] = 0
+    sizes = np.bincount(parent, minlength=start)[parent] if start else parent
+    return parent, sizes
+
+def extralines(held, fields, plan, version):
+    # The extra TEL/EMAIL lines of each group in held, by root: every number or address
+    # not yet on the merged card (the first non-empty one of each field is), in row order
+    parts = []
+    for number, field in enumerate(fields):
+        text = held[f"t{number}"]
+        key = held[f"k{number}"]
+        filled = key != ""
+        parts.append(pd.DataFrame({"root": held["root"][filled], "row": held["row"][filled], "order": number, "kind": field.kind, "key": key[filled], "text": text[filled]}))
+    if not parts:
+        return pd.Series(dtype=object)
+    long = pd.concat(parts).sort_values(["row", "order"], kind="stable")
+    seeds = long.sort_values(["order", "row"], kind="stable").drop_duplicates(["root", "order"])[["root", "kind", "key"]]
+    long = long.drop_duplicates(["root", "kind", "key"])
+    long = long.merge(seeds.assign(seed=True), on=["root", "kind", "key"], how="left", sort=False)
+    long = long[long["seed"].isna()]
+    if not len(long):
+        return pd.Series(dtype=object)
+    lines = pd.Series("", index=long.index, dtype=object)
+    for number, field in enumerate(fields):
+        selected = (long["order"] == number).to_numpy()
+        if not selected.any():
+            continue
+        text = long["text"][selected]
+        if plan.spec:
+            from vcardspec import proplines, versiontable
+            ver, table = versiontable(version)
+            lines[selected] = proplines(ver, table, field, text)
+        else:
+            lines[selected] = field.prefix + text + "\n"
+    return lines.groupby(long["root"].to_numpy(), sort=False).sum()  # Joined in row order
+
+def iter_dedup(chunks, plan, groups, stats=None, version=None):
+    roots, sizes = groups
+    stats = stats if stats is not None else {}
+    stats.update(merged=0, groups=0)
+    fields = [field for field in plan.props if field.pos is not None and field.kind in ("tel", "email")]
+    multi = np.flatnonzero(sizes > 1)
+    closes = np.zeros(len(roots), dtype=np.int64)
+    np.maximum.at(closes, roots[multi], multi)  # By root: the group's last row, where its card is emitted
+    held = []  # Rows of groups still open with their keys: one frame per chunk, sorted by the row their group closes at
+    start = 0
+    for chunk in chunks:
+        end = start + len(chunk)
+        rows = np.arange(start, end)
+        single = sizes[start:end] == 1
+        out = chunk[single].copy()
+        out[EXTRA_COLUMN] = ""
+        out.index = rows[single]
+        if not single.all():
+            part = chunk[~single]
+            # Columns by position (d0, d1, ...) next to the keys (t0/k0, ...): labels may clash
+            members = part.set_axis([f"d{number}" for number in range(part.shape[1])], axis=1).reset_index(drop=True)
+            members["row"] = rows[~single]
+            members["root"] = roots[rows[~single]]
+            members["closes"] = closes[members["root"].to_numpy()]
+            for number, (field, text, key) in enumerate(keycolumns(part, plan)):
+                members[f"t{number}"] = text.to_numpy()
+                members[f"k{number}"] = key.to_numpy()
+            held.append(members.sort_values("closes", kind="stable"))
+            # Groups whose last row is in this chunk are complete: cut their rows off the front of every held frame
+            parts = []
+            for number, frame in enumerate(held):
+                cut = int(np.searchsorted(frame["closes"].to_numpy(), end))
+                parts.append(frame.iloc[:cut])
+                held[number] = frame.iloc[cut:]
+            held = [frame for frame in held if len(frame)]
+            done = pd.concat(parts, ignore_index=True)
+            if len(done):
+                data = [f"d{number}" for number in range(chunk.shape[1])]
+                merged = done.groupby("root", sort=False)[data].first()  # First non-empty value of every column
+                merged = merged.mask(merged.isna(), np.nan)  # Columns empty in the whole group come back as None
+                merged.columns = chunk.columns
+                merged[EXTRA_COLUMN] = extralines(done, fields, plan, version).reindex(merged.index, fill_value="")
+                merged.index = closes[merged.index.to_numpy()]
+                stats["groups"] += len(merged)
+                stats["merged"] += len(done) - len(merged)
+                out = pd.concat([out, merged]).sort_index()
+        start = end
+        if len(out):
+            yield out
@@ -0,0 +1,133 @@
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Incremental export: each row gets an identity (hash of its name fields, or of the
+# chosen key columns), details (hash of its phone and email fields) and a fingerprint
+# (hash of every mapped field). The index file keeps identity -> [[details, fingerprint,
+# UID], ...] from the previous run so only new or changed rows are generated, and every
+# card keeps the same UID from one run to the next, also when its numbers change. Rows
+# that share an identity are told apart by their details; one whose details changed
+# takes the UID of the only previous row of that name still unclaimed.
+
+UID_COLUMN = "vCard UID"
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".vcf", "index")
+NAMESPACE = uuid.UUID("5b1f6c1e-2f8e-4c1a-9a55-3c6f2b8e7d10")
+INDEX_VERSION = 3  # Version 2 hashed names, phones and emails into one identity
+
+def load_index(path):
+    if not path or not os.path.exists(path):
+        return {"version": INDEX_VERSION, "settings": None, "contacts": {}}
+    with open(path, encoding="utf-8") as file:
+        index = json.load(file)
+    if index.get("version") == 1:
+        # Identities were name (or key) hashes, counted "hash.1", ... for repeats: keep
+        # their UIDs, without details, so the rows of that name claim them in order
+        contacts = {}
+        for ident, (finger, uid) in index["contacts"].items():
+            contacts.setdefault(ident.split(".")[0], []).append([None, None, uid])
+        return {"version": INDEX_VERSION, "settings": index.get("settings"), "contacts": contacts}
+    if index.get("version") != INDEX_VERSION:
+        return {"version": INDEX_VERSION, "settings": None, "contacts": {}}
+    return index
+
+def save_index(path, index):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as file:
+        json.dump(index, file, separators=(",", ":"))
+    os.replace(tmp, path)  # Never leave a half-written index behind
+
+def with_uid(assign):
+    assign = dict(assign)
+    assign[f"UID{len(assign) + 1}"] = UID_COLUMN
+    return assign
+
+def settingshash(assign, version, **options):
+    # Constants, version and options change every card, so a change here marks all rows changed
+    payload = json.dumps([list(assign.items()), str(version), sorted(options.items())], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def hashrows(chunk, positions):
+    if not positions:
+        return np.zeros(len(chunk), dtype="uint64")
+    return pd.util.hash_pandas_object(chunk.iloc[:, positions].astype(str), index=False).to_numpy()
+
+def namepositions(plan):
+    return [field.pos for field in plan.names + plan.suffixes if field.pos is not None]
+
+def rowhashes(chunk, plan, key=None):
+    # (identity, details, fingerprint) per row
+    mapped = [field.pos for field in plan.names + plan.suffixes + plan.props if field.pos is not None and field.kind != "uid"]
+    if key:
+        columns = list(chunk.columns)
+        identity = [columns.index(column) for column in key if column in columns]
+    else:
+        identity = namepositions(plan)
+    details = [field.pos for field in plan.props if field.kind in ("tel", "email") and field.pos is not None]
+    # Without name or key columns the only identity a contact has is all of its fields
+    return hashrows(chunk, identity or mapped), hashrows(chunk, details), hashrows(chunk, mapped)
+
+def counted(ident, seen):
+    # Identity of the n-th row with the same identity within the file
+    count = seen.get(ident, 0)
+    seen[ident] = count + 1
+    return f"{ident}.{count}" if count else ident
+
+def match(entries, details, claimed):
+    # The previous run's entry for a row: the first unclaimed one with the same details,
+    # else one kept from a version 1 index, else the only unclaimed one left
+    left = [entry for entry in entries if entry[2] not in claimed]
+    for entry in left:
+        if entry[0] == details:
+            return entry
+    for entry in left:
+        if entry[0] is None:
+            return entry
+    return left[0] if len(left) == 1 else None
+
+def iter_delta(chunks, plan, index, settings, key=None, stats=None):
+    previous = index["contacts"]
+    allchanged = index.get("settings") != settings
+    current = {}
+    seen = {}
+    claimed = set()  # Previous UIDs already given to a row
+    used = {entry[2] for entries in previous.values() for entry in entries}  # New UIDs never repeat one
+    stats = stats if stats is not None else {}
+    stats.update(new=0, changed=0, unchanged=0, removed=[])
+    for chunk in chunks:
+        identity, details, fingerprint = rowhashes(chunk, plan, key)
+        keep = []
+        uids = []
+        for ident, detail, finger in zip(identity, details, fingerprint):
+            ident, detail, finger = f"{ident:016x}", f"{detail:016x}", f"{finger:016x}"
+            old = match(previous.get(ident, ()), detail, claimed)
+            if old is None:
+                uid = str(uuid.uuid5(NAMESPACE, counted(f"{ident}.{detail}", seen)))
+                while uid in used:
+                    uid = str(uuid.uuid5(NAMESPACE, counted(f"{ident}.{detail}", seen)))
+                used.add(uid)
+            else:
+                uid = old[2]
+                claimed.add(uid)
+            current.setdefault(ident, []).append([detail, finger, uid])
+            if old is None:
+                stats["new"] += 1
+            elif allchanged or old[1] != finger:
+                stats["changed"] += 1
+            else:
+                stats["unchanged"] += 1
+                keep.append(False)
+                continue
+            keep.append(True)
+            uids.append(uid)
+        if uids:
+            chunk = chunk[keep].copy()
+            chunk[UID_COLUMN] = uids
+            yield chunk
+    index["contacts"] = current
+    index["settings"] = settings
+    stats["removed"] = [entry[2] for entries in previous.values() for entry in entries if entry[2] not in claimed]
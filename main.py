@@ -1,8 +1,30 @@
+import os
+import time
 import streamlit as st
 import pandas as pd
-from vcard import gen_vcard
+from vcard import compile_assign
+from functools import partial
+from parallel import iter_parallel, render_cards, cpucount, MIN_PARALLEL_ROWS
+from reader import FILETYPES, SNAPSHOT, filetype, scan, sample, sheetnames, iter_chunks, read_rows
+from cache import CACHE_DIR, contenthash, outputkey, outputfile, cached_output, store_output
+from batch import Job, jobfile, joblabel, jobstem, run_jobs, convert_job
+import vcfparser
+import delta
+import dedup
+import validate
+import perf
+from profiles import delete_profile, find_profile, headerkey, headersignature, load_profiles, profile_mapping, save_profile
+from shard import ShardWriter
+from photo import Photos, ThumbnailCache, iter_photos
+from snapshot import SNAPSHOT_DIR, open_snapshot
+from progress import Progress, streamlit_display
 from utils import textedit
-from utils import columncheck
+from utils import columnfield, mappedcolumns, revgen, COLUMNOPTIONS, TYPEOPTIONS
+import shutil
+import zipfile
+import tempfile
+
+SAMPLE_ROWS = 1000  # Rows kept for the preview and the mapping; later pages are read on demand
 
 def apply_custom_css():
     st.markdown("""
@@ -193,6 +215,182 @@ def apply_custom_css():
     </style>
     """, unsafe_allow_html=True)
 
+def uploadhash(uploaded_file):
+    # Hash each upload once instead of on every rerun
+    key = f"upload_hash_{getattr(uploaded_file, 'file_id', None)}"
+    if key not in st.session_state or key.endswith("_None"):
+        st.session_state[key] = contenthash(uploaded_file.getvalue())
+    return st.session_state[key]
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_upload(filehash, file_extension, _uploaded_file):
+    # First phase: stream the file once to find the non-empty columns and rows, then keep
+    # only the first rows in memory for the preview and the mapping samples. Generation
+    # reads the mapped columns alone in a second pass.
+    stats = {}
+    columns, total_rows = scan(_uploaded_file, file_extension, stats=stats)
+    df = sample(_uploaded_file, file_extension, columns, rows=SAMPLE_ROWS)
+    samples = {column: (examples(df[column]), 1 - stats["filled"][column] / total_rows if total_rows else 1.0) for column in columns}
+    return columns, total_rows, df, samples, stats.get("blank")
+
+def examples(col, count=5):
+    values = col.dropna().astype(str).str.strip()
+    return values[values != ""].drop_duplicates().head(count).tolist()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_page(filehash, file_extension, columns, start, count, _uploaded_file):
+    return read_rows(_uploaded_file, file_extension, columns, start, count)
+
+def turnpage(page_key, step, pages):
+    # Button callback: runs before the rerun renders, so the page and the buttons agree
+    st.session_state[page_key] = min(max(st.session_state.get(page_key, 0) + step, 0), pages - 1)
+
+def preview(filehash, file_extension, uploaded_file, columns, total_rows, df):
+    # Only one page of rows is sent to the browser; pages past the first chunk are read on demand
+    size = st.selectbox("Rows per page", options=[25, 50, 100, 500], key="preview_size")
+    pages = max((total_rows - 1) // size + 1, 1)
+    page_key = f"preview_page_{filehash}"
+    page = min(st.session_state.get(page_key, 0), pages - 1)
+    st.session_state[page_key] = page
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        st.button("◀ Previous", key="preview_prev", disabled=page == 0, on_click=turnpage, args=(page_key, -1, pages))
+    with col3:
+        st.button("Next ▶", key="preview_next", disabled=page >= pages - 1, on_click=turnpage, args=(page_key, 1, pages))
+    start = page * size
+    if start + size <= len(df) or len(df) >= total_rows:
+        window = df.iloc[start:start + size]
+    else:
+        window = load_page(filehash, file_extension, columns, start, size, uploaded_file)
+    with col2:
+        st.caption(f"Rows {start + 1:,}–{start + len(window):,} of {total_rows:,} (page {page + 1:,} of {pages:,})")
+    st.dataframe(window, use_container_width=True)
+
+def export_vcf(uploaded_file):
+    st.success("📇 vCard file detected - Convert it back into a spreadsheet!")
+    st.markdown('<div class="section-header">📤 Export Contacts</div>', unsafe_allow_html=True)
+    sheet_format = st.radio("Spreadsheet format", options=["CSV", "XLSX"], horizontal=True)
+    
+    if st.button("🎯 Convert to spreadsheet", key="export_vcf", use_container_width=True):
+        with st.spinner("Reading contacts... Please wait!"):
+            uploaded_file.seek(0)
+            records = vcfparser.iter_records(uploaded_file)
+            # Write straight to disk so the records are never all held in memory
+            out = outputfile()
+            out.close()
+            if sheet_format == "XLSX":
+                count = vcfparser.write_xlsx(records, out.name)
+            else:
+                with open(out.name, "w", encoding="utf-8", newline="") as sheet:
+                    count = vcfparser.write_csv(records, sheet)
+            
+            st.success(f"✅ Exported {count} contacts!")
+            filename = uploaded_file.name.rsplit('.', 1)[0]
+            with open(out.name, "rb") as sheet:
+                st.download_button(
+                    "📥 Download spreadsheet",
+                    sheet,
+                    file_name=f"{filename}.{sheet_format.lower()}",
+                    mime="text/csv" if sheet_format == "CSV" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    use_container_width=True
+                )
+            os.remove(out.name)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_sheets(filehash, _uploaded_file):
+    return sheetnames(_uploaded_file)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_job(filehash, name, sheet, _job):
+    # Columns, rows and the first rows of one file or sheet of a batch
+    with jobfile(_job) as file:
+        columns, total_rows = scan(file, filetype(name), sheet=sheet)
+        return columns, total_rows, sample(file, filetype(name), columns, sheet=sheet)
+
+def batch_mode():
+    # Several uploads, or every sheet of a workbook, each converted to its own .vcf by a
+    # queue of worker processes and downloaded together as a ZIP
+    uploads = st.file_uploader("Drag and drop your files here", type=FILETYPES, accept_multiple_files=True, key="batch_files")
+    if not uploads:
+        st.warning("⚠️ Please upload one or more files to continue.")
+        return
+    all_sheets = st.checkbox("Convert every sheet of Excel workbooks", value=True, help="Each sheet becomes its own .vcf file, named after the workbook and the sheet. Otherwise only the first sheet is read.")
+    jobs = []
+    for upload in uploads:
+        filehash = uploadhash(upload)
+        sheets = load_sheets(filehash, upload) if all_sheets and filetype(upload.name) == "xlsx" else [None]
+        jobs += [(Job(upload.name, upload.getvalue(), sheet), filehash) for sheet in sheets]
+
+    st.markdown('<div class="section-header">🔗 Column Mapping</div>', unsafe_allow_html=True)
+    shared = st.radio("Map the columns", options=["Once for all files", "Once per set of headers"], horizontal=True, help="With one mapping for all files, a column name is mapped the same way wherever it appears. Per set of headers, files and sheets with the same columns share a mapping (and a saved profile, if there is one).") == "Once for all files"
+    groups = {}  # mapping key -> {"columns": [...], "keys": {headerkey}, "sample": {column: Series}, "jobs": [...], "signatures": set()}
+    for job, filehash in jobs:
+        columns, total_rows, df = load_job(filehash, job.name, job.sheet, job)
+        signature = headersignature(columns)
+        group = groups.setdefault("all" if shared else signature, {"columns": [], "keys": set(), "sample": {}, "jobs": [], "signatures": set()})
+        group["jobs"].append(f"{joblabel(job)} ({total_rows:,} rows)")
+        group["signatures"].add(signature)
+        for column in columns:
+            if headerkey(column) not in group["keys"]:
+                group["keys"].add(headerkey(column))
+                group["columns"].append(str(column))
+                group["sample"][str(column)] = df[column]
+    options = ["NONE"]
+    for field in COLUMNOPTIONS[1:]:
+        options += [f"{field}+{typ}" for typ in TYPEOPTIONS[field]] if field in TYPEOPTIONS else [field]
+    mappings = {}
+    for number, (key, group) in enumerate(groups.items(), 1):
+        profile_name = None if shared else find_profile(group["columns"])
+        known = profile_mapping(load_profiles()[profile_name])[0] if profile_name else {}
+        title = "All files" if shared else f"Header set {number}" + (f" (profile '{profile_name}')" if profile_name else "")
+        with st.expander(f"{title}: {len(group['jobs'])} files or sheets, {len(group['columns'])} columns", expanded=len(groups) == 1):
+            st.caption(", ".join(group["jobs"]))
+            mapping = {}
+            for column in group["columns"]:
+                value = known.get(headerkey(column)) or columnfield(column, group["sample"][column].head(100))
+                field, _, subtype = value.partition("+")
+                if field in TYPEOPTIONS and subtype not in TYPEOPTIONS[field]:
+                    value = field + "+" + TYPEOPTIONS[field][0]  # No subtype, or one the widgets lack: the default
+                value = value if value in options else "NONE"
+                mapping[headerkey(column)] = st.selectbox(f"Map '{column}' to:", options=options, index=options.index(value), key=f"batch_{key}_{column}")
+        for signature in group["signatures"]:
+            mappings[signature] = mapping
+
+    st.markdown('<div class="section-header">⚙️ vCard Settings</div>', unsafe_allow_html=True)
+    is_ios = st.checkbox("Is this vCard for iOS devices?", key="batch_ios", help="Writes vCard 2.1")
+    strict = st.checkbox("Standards-compliant vCard", key="batch_strict")
+    vcard4 = strict and st.checkbox("Use vCard 4.0", key="batch_vcard4")
+    country_code = st.text_input("Default country code for phone numbers (optional)", key="batch_country_code", placeholder="e.g. 91")
+    workers = int(st.number_input("Files converted at once", min_value=1, max_value=max(cpucount(), 8), value=min(cpucount(), len(jobs)), step=1, help="Each file or sheet is converted by its own worker process."))
+    ver = 4.0 if vcard4 else 2.1 if is_ios else 3.0
+
+    if st.button("🎯 Generate vCards", key="generate_batch", use_container_width=True):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        directory = tempfile.mkdtemp(dir=CACHE_DIR)  # One .vcf per job, zipped once all are done
+        task = partial(convert_job, directory=directory, mappings=mappings, version=ver, country_code=country_code, spec=strict, rev=revgen())
+        statuses = {joblabel(job): {"File": joblabel(job), "Status": "⏳ Queued", "Contacts": None, "Seconds": None} for job, _ in jobs}
+        table = st.empty()
+        table.dataframe(pd.DataFrame(statuses.values()), hide_index=True, use_container_width=True)
+        done = []
+        for job, status in run_jobs([job for job, _ in jobs], task, workers):
+            row = statuses[joblabel(job)]
+            row["Seconds"] = round(status["seconds"], 2)
+            if status["state"] == "done":
+                row["Status"], row["Contacts"] = "✅ Done", status["rows"]
+                done.append(job)
+            else:
+                row["Status"] = f"❌ {status['error']}"
+            table.dataframe(pd.DataFrame(statuses.values()), hide_index=True, use_container_width=True)
+        with outputfile(".zip") as out:
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+                for job in done:
+                    archive.write(os.path.join(directory, jobstem(job) + ".vcf"), jobstem(job) + ".vcf")
+        shutil.rmtree(directory, ignore_errors=True)
+        st.success(f"✅ Converted {len(done)} of {len(jobs)} files or sheets, {sum(row['Contacts'] or 0 for row in statuses.values()):,} contacts")
+        with open(out.name, "rb") as archive:
+            st.download_button("📥 Download vCards (ZIP)", archive, file_name="vcards.zip", mime="application/zip", use_container_width=True)
+        os.remove(out.name)
+
 def main():
     apply_custom_css()
     
@@ -201,7 +399,10 @@ def main():
     
     # File upload section
     st.markdown('<div class="section-header">📤 Upload Your File</div>', unsafe_allow_html=True)
-    uploaded_file = st.file_uploader("Drag and drop your file here", type=["xlsx", "csv", "tsv"])
+    if st.toggle("Batch mode: several files, or every sheet of a workbook", key="batch_mode"):
+        batch_mode()
+        return
+    uploaded_file = st.file_uploader("Drag and drop your file here", type=["xlsx", "csv", "tsv", "vcf"])
     
     # Help section for file upload
     with st.expander("ℹ️ Need help with file upload?", expanded=False):
@@ -212,6 +413,7 @@ def main():
         - **Excel (.xlsx)**: Spreadsheets created in Microsoft Excel
         - **CSV (.csv)**: Comma-separated values files
         - **TSV (.tsv)**: Tab-separated values files
+        - **vCard (.vcf)**: Contact exports from a phone, converted back into a spreadsheet
         
         **Tips for preparing your file:**
         1. Make sure your file has a header row with column names
@@ -223,18 +425,17 @@ def main():
         After uploading, the app will automatically detect the file type and load your data.
         """)
     
-    if uploaded_file is not None:
+    if uploaded_file is not None and filetype(uploaded_file.name) == "vcf":
+        export_vcf(uploaded_file)
+    elif uploaded_file is not None:
         # Auto-detect file type based on extension
-        file_extension = uploaded_file.name.split('.')[-1].lower()
+        file_extension = filetype(uploaded_file.name)
         
         if file_extension == 'xlsx':
-            df = pd.read_excel(uploaded_file)
             file_type_message = "📊 Excel file detected - Perfect for structured data!"
         elif file_extension == 'csv':
-            df = pd.read_csv(uploaded_file)
             file_type_message = "📄 CSV file detected - Great for simple comma-separated data!"
         elif file_extension == 'tsv':
-            df = pd.read_csv(uploaded_file, sep='\t')
             file_type_message = "📋 TSV file detected - Ideal for tab-separated data!"
         else:
             st.error("Unsupported file type.")
@@ -242,9 +443,16 @@ def main():
         
         st.success(file_type_message)
         
-        df = df.dropna(axis=1, how='all')  # Remove empty columns
-        df = df.reset_index(drop=True)  # Reset index after dropping columns
-        df = df.dropna(how='all')  # Remove rows that are completely empty
+        filehash = uploadhash(uploaded_file)
+        # A workbook is parsed once into a columnar snapshot; every later read, of this
+        # upload or of the same workbook uploaded again, comes from the snapshot
+        source, source_type = uploaded_file, file_extension
+        if file_extension == "xlsx" and st.checkbox("Keep a fast snapshot of this workbook", value=True, key="use_snapshot", help=f"The first load saves the sheet in {SNAPSHOT_DIR}. The same workbook uploaded again is read from there instead of being parsed again."):
+            with st.spinner("Reading the workbook..."):
+                snapshot = open_snapshot(uploaded_file, filehash)
+            if snapshot is not None:
+                source, source_type = snapshot, SNAPSHOT
+        columns, total_rows, df, samples, blank = load_upload(filehash, source_type, source)
             
         filename = uploaded_file.name.split('.')[0]
         st.success(f"✅ File loaded successfully: **{filename}**")
@@ -254,6 +462,26 @@ def main():
         st.markdown('<div class="section-header">⚙️ vCard Settings</div>', unsafe_allow_html=True)
         is_ios = st.checkbox("Is this vCard for iOS devices?", help="Check if you want to optimize the vCard for iOS compatibility")
         st.session_state["is_ios"] = is_ios
+        strict = st.checkbox("Standards-compliant vCard", help="Escapes commas, semicolons and line breaks, folds long lines, writes structured names and addresses, and uses quoted-printable for non-English text in vCard 2.1. Empty fields are left out.")
+        vcard4 = strict and st.checkbox("Use vCard 4.0", help="The newest format (RFC 6350). Recent Android and macOS contact apps read it; older phones may not.")
+        country_code = st.text_input("Default country code for phone numbers (optional)", placeholder="e.g. 91", help="When set, phone numbers are written in international E.164 form (+91...). Numbers that already start with + or 00 keep their own code.")
+        incremental = st.checkbox("Only export new or changed contacts", help=f"Remembers every contact of this file name in {delta.INDEX_DIR} and skips the ones that have not changed since the last export. Cards keep the same UID between runs so phones update them in place.")
+        merge_duplicates = st.checkbox("Merge duplicate contacts (same phone or email)", help="Rows sharing a phone number or email address become one card holding all of their numbers and addresses. The file is read twice.")
+        split_output = st.checkbox("Split into several files (ZIP)", help="Some phones fail to import very large .vcf files. The cards are split into smaller files and downloaded together as a ZIP archive.")
+        max_contacts = max_mb = 0
+        group_by = None
+        if split_output:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                max_contacts = int(st.number_input("Contacts per file (0 = no limit)", min_value=0, value=1000, step=100))
+            with col2:
+                max_mb = st.number_input("MB per file (0 = no limit)", min_value=0.0, value=0.0, step=0.5)
+            with col3:
+                group_by = st.selectbox("One set of files per value of", options=["(none)"] + list(columns), help="e.g. Organization, to get one file per company")
+                group_by = None if group_by == "(none)" else group_by
+        invalid_rows = st.selectbox("Rows with problems", options=["Keep", "Skip", "Skip and download separately"], help="Rows without a name, with a phone number that has no digits, or with a malformed email address. They are always counted in the data-quality report.")
+        show_perf = st.checkbox("Show performance details", value=perf.FROM_ENV, help="Times each stage of the generation (reading, cleaning, checking, each field, writing) and shows where the time went. The file is converted again instead of being taken from the cache.")
+        workers = int(st.number_input("Worker processes", min_value=1, max_value=max(cpucount(), 8), value=cpucount(), step=1, help=f"Large files are split across this many processes. Files under {MIN_PARALLEL_ROWS} rows are always converted in-process."))
         
         # Help section for iOS setting
         with st.expander("ℹ️ Need help with vCard settings?", expanded=False):
@@ -274,14 +502,21 @@ def main():
         
         # Data preview section
         st.markdown('<div class="section-header">👀 Data Preview</div>', unsafe_allow_html=True)
-        with st.expander("View your data", expanded=False):
-            st.dataframe(df, use_container_width=True)
+        with st.expander(f"View your data ({total_rows:,} rows, {len(columns)} columns)", expanded=False):
+            preview(filehash, source_type, source, columns, total_rows, df)
         # Column mapping section
         st.markdown('<div class="section-header">🔗 Column Mapping</div>', unsafe_allow_html=True)
         st.info("Map each column in your data to the appropriate vCard field")
         
-        column_names = df.columns.tolist()
-        columnoptions = ["NONE","Address", "Name", "Phone Number", "Email","Suffix","Organization", "Job Title","NOTE"]
+        # A profile saved for the same set of headers fills in every widget below
+        profile_name = find_profile(columns)
+        use_profile = profile_name is not None and st.checkbox(f"Use saved mapping profile '{profile_name}'", value=True, help="Saved for files with exactly these column names. Uncheck to map the columns yourself.")
+        if profile_name is not None:
+            st.button(f"🗑️ Delete profile '{profile_name}'", key="delete_profile", on_click=delete_profile, args=(profile_name,), help="Forgets the saved mapping; files with these columns are mapped automatically again.")
+        known, saved = profile_mapping(load_profiles()[profile_name]) if use_profile else ({}, [])
+        
+        column_names = columns
+        columnoptions = COLUMNOPTIONS  # The same list automap() and batch mode map to
         
         assign = {}
         ind = 0
@@ -293,12 +528,21 @@ def main():
                 col1, col2 = st.columns([2, 3])
                 
                 with col1:
+                    values, empty = samples[column]
                     st.write("Sample data:")
-                    st.code(str(df[column].iloc[0]) if not df[column].empty else "No data")
+                    st.code("\n".join(values) if values else "No data")
+                    st.caption(f"{empty:.0%} of rows empty")
                 
                 with col2:
-                    value = columncheck(column)
-                    if value:
+                    if use_profile:
+                        value, _, subtype = known.get(headerkey(column), "NONE").partition("+")
+                    else:
+                        value, _, subtype = columnfield(column, df[column].head(100)).partition("+")
+                    value = "" if value == "NONE" else value
+                    if value and use_profile:
+                        st.success(f"From profile '{profile_name}': {value}")
+                        value = st.selectbox(f"Map '{column}' to:", options=columnoptions, index=columnoptions.index(value) if value in columnoptions else 0, key=column)
+                    elif value:
                         st.success(f"Auto-mapped to: {value}")
                         st.info(f"Auto-mapped to: {value}. You can change this if needed.")
                         value = st.selectbox(f"Map '{column}' to:", options=columnoptions, index=columnoptions.index(value) if value in columnoptions else 0, key=column)
@@ -306,7 +550,8 @@ def main():
                         value = st.selectbox(f"Map '{column}' to:", options=columnoptions, key=column)
                     
                     if value == "Phone Number" or value == "Email":
-                        typ = st.selectbox(f"Select type for {value}", options=["Mobile" , "Work", "Home"], key=f"{column}_type")
+                        typeoptions = TYPEOPTIONS[value]
+                        typ = st.selectbox(f"Select type for {value}", options=typeoptions, index=typeoptions.index(subtype) if subtype in typeoptions else 0, key=f"{column}_type")
                         value = value + "+" + typ
                 
                 value = value + str(ind)
@@ -340,7 +585,7 @@ def main():
         
         # Additional fields section
         st.markdown('<div class="section-header">➕ Additional Fields</div>', unsafe_allow_html=True)
-        is_there = st.checkbox("Add common fields to all contacts", help="Add fields that will be the same for all contacts")
+        is_there = st.checkbox("Add common fields to all contacts", value=bool(saved), help="Add fields that will be the same for all contacts")
         
         # Help section for additional fields
         with st.expander("ℹ️ Need help with additional fields?", expanded=False):
@@ -362,24 +607,40 @@ def main():
             4. These values will be added to EVERY contact in the final vCard
             """)
         
-        ver = 2.1 if st.session_state.get("is_ios", False) else 3.0
+        ver = 4.0 if vcard4 else 2.1 if st.session_state.get("is_ios", False) else 3.0
         if is_there:
-            no_of_such = int(st.number_input("Number of additional fields", key="new_value", min_value=1, max_value=10, step=1))
+            no_of_such = int(st.number_input("Number of additional fields", key="new_value", min_value=1, max_value=10, value=min(max(len(saved), 1), 10), step=1))
             
             for i in range(no_of_such):
                 ind += 1
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    new_value = st.text_input(f"Value for field {i+1}", key=f"new_value_{i}", placeholder="Enter the value...")
+                    new_value = st.text_input(f"Value for field {i+1}", key=f"new_value_{i}", value=saved[i][1] if i < len(saved) else "", placeholder="Enter the value...")
                 
                 with col2:
-                    value = st.selectbox(f"Field type {i+1}", options=columnoptions, key=f"new_value{i}")
+                    field = saved[i][0] if i < len(saved) else "NONE"
+                    constoptions = [option for option in columnoptions if option != "Photo"]
+                    value = st.selectbox(f"Field type {i+1}", options=constoptions, index=constoptions.index(field) if field in constoptions else 0, key=f"new_value{i}")
                 
                 value = "!" + value + str(ind)
                 if new_value:
                     assign[value] = new_value
         
+        # Images for the Photo columns come from an uploaded ZIP; paths on the server are never read
+        photo_zip = None
+        if any(key.startswith("Photo") for key in assign):
+            photo_zip = st.file_uploader("ZIP of the contact photos", type=["zip"], key="photo_zip", help="The Photo column names an image in the archive, e.g. jane.jpg or photos/jane.jpg. Photos are shrunk to small JPEG thumbnails before they are embedded.")
+            if photo_zip is None:
+                st.info("Upload the photos as a ZIP archive, or the cards are generated without them.")
+        
+        # Save the mapping so the next file with these columns needs no changes
+        with st.expander("💾 Save this mapping as a profile", expanded=False):
+            new_profile = st.text_input("Profile name", value=profile_name or filename, key="profile_name")
+            if st.button("Save profile", key="save_profile") and new_profile:
+                save_profile(new_profile, columns, assign)
+                st.success(f"✅ Saved profile '{new_profile}'. Files with the same columns will use it automatically.")
+        
         # Generation section
         st.markdown('<div class="section-header">🚀 Generate vCard</div>', unsafe_allow_html=True)
         
@@ -434,24 +695,124 @@ def main():
         
         if generate_btn:
             with st.spinner("Generating vCard... Please wait!"):
-                vcardtext = ""
-                progress_bar = st.progress(0)
-                total_rows = len(df)
+                shards = (max_contacts, int(max_mb * 1024 * 1024), group_by) if split_output else None
+                key = outputkey(filehash, assign, ver, country_code=country_code, dedup=merge_duplicates, shards=shards, strict=strict, invalid=invalid_rows, photos=photo_zip and uploadhash(photo_zip))
+                path = None if incremental or show_perf else cached_output(key)
                 
-                for index, row in df.iterrows():
-                    vcardtext += gen_vcard(row=row, assign=assign, version=ver)
-                    progress_bar.progress((index + 1) / total_rows)
+                if path is None:
+                    with perf.collecting(show_perf):  # This run only: other sessions share the process
+                        started = time.perf_counter()
+                        progress = Progress(total_rows, streamlit_display(st.progress(0)))
+                        plan_assign = assign
+                        usecols = mappedcolumns(columns, assign, [group_by]) or None  # Only the mapped columns are loaded, as text
+                        generated = list(usecols or columns)
+                        if merge_duplicates:
+                            plan_assign = dedup.with_extra(plan_assign)
+                            generated.append(dedup.EXTRA_COLUMN)
+                        if incremental:
+                            index_path = os.path.join(delta.INDEX_DIR, f"{filename}.index.json")
+                            index = delta.load_index(index_path)
+                            settings = delta.settingshash(plan_assign, ver, country_code=country_code, **({"strict": True} if strict else {}))
+                            plan_assign = delta.with_uid(plan_assign)
+                            generated.append(delta.UID_COLUMN)
+                        plan = compile_assign(plan_assign, generated, country_code, spec=strict)
+                        text_columns = usecols or columns
+                        read = {}
+                        stats = {}
+                        merges = {}
+                        report = validate.new_report()
+                        skip = invalid_rows != "Keep"
+                        quarantine = tempfile.TemporaryFile("w+", encoding="utf-8", newline="") if invalid_rows == "Skip and download separately" else None
+                        out = outputfile(".zip" if split_output else ".vcf")
+                        try:
+                            # Stream the cards to disk so only one chunk is held in memory at a time
+                            with out:
+                                chunks = perf.iterate("validate", validate.iter_validate(iter_chunks(source, source_type, columns, text=text_columns, stats=read, usecols=usecols, blank=blank), plan, report, skip, quarantine))
+                                if merge_duplicates:
+                                    first = iter_chunks(source, source_type, columns, text=text_columns, usecols=usecols, blank=blank)
+                                    with perf.stage("dedup.group"):
+                                        groups = dedup.find_groups(validate.iter_validate(first, plan, skip=skip), plan, stats=merges)
+                                    chunks = perf.iterate("dedup.merge", dedup.iter_dedup(chunks, plan, groups, stats=merges, version=ver))
+                                if incremental:
+                                    chunks = perf.iterate("delta", delta.iter_delta(chunks, plan, index, settings, stats=stats))
+                                photos = Photos(archive=photo_zip, cache=ThumbnailCache(), local=False) if photo_zip is not None else Photos(local=False)
+                                chunks = perf.iterate("photos", iter_photos(chunks, plan, photos))
+                                if split_output:
+                                    with ShardWriter(out, filename, shards[0], shards[1]) as writer:
+                                        for rows, (cards, groups) in iter_parallel(chunks, plan, version=ver, workers=workers, total_rows=total_rows, task=partial(render_cards, group=group_by)):
+                                            with perf.stage("write"):
+                                                writer.write(cards, groups)
+                                            if show_perf:
+                                                perf.count("bytes.written", sum(len(card) for card in cards))
+                                            progress.update(read.get("rows", 0))
+                                else:
+                                    for rows, text in iter_parallel(chunks, plan, version=ver, workers=workers, total_rows=total_rows):
+                                        with perf.stage("write"):
+                                            out.write(text)
+                                        perf.count("bytes.written", len(text))
+                                        progress.update(read.get("rows", 0))
+                            if quarantine is not None:
+                                quarantine.seek(0)
+                                st.session_state[f"quarantine_{key}"] = quarantine.read()
+                        except BaseException:
+                            os.remove(out.name)  # No partial output left in the cache directory
+                            raise
+                        finally:
+                            if quarantine is not None:
+                                quarantine.close()  # A temporary file: removed on close
+                        progress.finish()
+                        if show_perf:
+                            perf.add("total", time.perf_counter() - started, own=0)  # Own time is in the stages
+                            st.session_state[f"perf_{key}"] = perf.rows()
+                    photos.close()
+                    st.session_state[f"report_{key}"] = report
+                    if merge_duplicates:
+                        st.session_state[f"merges_{key}"] = merges
+                    if incremental:
+                        delta.save_index(index_path, index)
+                        path = out.name
+                    else:
+                        path = store_output(key, out.name)
                 
-                st.success(f"✅ Generated vCard for {total_rows} contacts!")
+                merges = st.session_state.get(f"merges_{key}") if merge_duplicates else None
+                report = st.session_state.get(f"report_{key}")
+                skipped = report["invalid"] if report and invalid_rows != "Keep" else 0
+                if incremental:
+                    st.success(f"✅ {stats['new']} new and {stats['changed']} changed contacts exported, {stats['unchanged']} unchanged skipped, {len(stats['removed'])} removed since the last run")
+                else:
+                    st.success(f"✅ Generated vCard for {total_rows - skipped - (merges['merged'] if merges else 0)} contacts!")
+                if merges:
+                    st.info(f"🔀 Merged {merges['merged']} duplicate rows into {merges['groups']} contacts")
+                    if merges.get("ignored"):
+                        st.caption(f"{merges['ignored']} phone numbers or email addresses shared by more than {dedup.MAX_SHARED} rows look like placeholders and were not used for merging.")
                 
-                with col2:
+                with col2, open(path, "rb") as vcardfile:
                     st.download_button(
                         "📥 Download vCard", 
-                        vcardtext, 
-                        file_name=f"{filename}.vcf",
-                        mime="text/vcard",
+                        vcardfile, 
+                        file_name=f"{filename}.zip" if split_output else f"{filename}.vcf",
+                        mime="application/zip" if split_output else "text/vcard",
                         use_container_width=True
                     )
+                if report and report["invalid"]:
+                    action = {"Keep": "kept in the output", "Skip": "left out", "Skip and download separately": "left out"}[invalid_rows]
+                    st.warning(f"⚠️ {report['invalid']} of {report['rows']} rows have data-quality issues ({action})")
+                    st.dataframe(pd.DataFrame([{"Issue": validate.ISSUES[issue], "Rows": entry["count"], "First rows": ", ".join(str(row) for row in entry["rows"])} for issue, entry in report["issues"].items() if entry["count"]]), hide_index=True, use_container_width=True)
+                    st.download_button("📥 Download data-quality report", validate.report_csv(report), file_name=f"{filename}.report.csv", mime="text/csv")
+                    quarantined = st.session_state.get(f"quarantine_{key}")
+                    if quarantined:
+                        st.download_button("📥 Download rows with problems", quarantined, file_name=f"{filename}.invalid.csv", mime="text/csv")
+                if incremental:
+                    os.remove(path)
+                    if stats["removed"]:
+                        st.download_button("📥 Download removed contact UIDs", "\n".join(stats["removed"]) + "\n", file_name=f"{filename}.removed.txt", mime="text/plain")
+                timings = st.session_state.get(f"perf_{key}") if show_perf else None
+                if timings:
+                    table, counters = timings
+                    with st.expander("⏱️ Performance", expanded=True):
+                        st.caption("Own seconds leave out the stages that ran inside a stage. Stages run in worker processes add up their CPU time, which can exceed the total.")
+                        st.dataframe(pd.DataFrame(table), hide_index=True, use_container_width=True)
+                        st.write(", ".join(f"**{name}:** {amount:,}" for name, amount in counters.items()))
         
         # Assignment summary
         if assign:
@@ -466,7 +827,7 @@ def main():
         st.markdown("""
         <div style="text-align: center; padding: 2rem;">
             <h3 style="color: #666;">Supported file formats:</h3>
-            <p style="color: #888;">📊 Excel (.xlsx) • 📄 CSV (.csv) • 📋 TSV (.tsv)</p>
+            <p style="color: #888;">📊 Excel (.xlsx) • 📄 CSV (.csv) • 📋 TSV (.tsv) • 📇 vCard (.vcf)</p>
         </div>
         """, unsafe_allow_html=True)
     
@@ -0,0 +1,78 @@
+import os
+import multiprocessing
+import perf
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from vcard import gen_vcards, gencards
+from utils import revgen
+
+# Below this many rows starting the worker processes costs more than it saves
+MIN_PARALLEL_ROWS = 50000
+
+def cpucount():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def workercount(workers=None, total_rows=None):
+    if total_rows is not None and total_rows < MIN_PARALLEL_ROWS:
+        return 1
+    return max(1, workers or cpucount())
+
+def render(chunk, plan, version, rev):
+    with perf.stage("generate"):
+        return gen_vcards(chunk, plan, version, rev).encode("utf-8")
+
+def render_cards(chunk, plan, version, rev, group=None):
+    # Cards kept apart, with the value of the group column for each, for sharded output
+    with perf.stage("generate"):
+        cards = [card.encode("utf-8") for card in gencards(chunk, plan, version, rev).tolist()]
+    if group is None:
+        return cards, None
+    values = chunk[group]
+    return cards, values.where(values.notna(), "").astype(str).str.strip().tolist()
+
+def iter_parallel(chunks, plan, version="2.1", workers=None, total_rows=None, rev=None, task=render):
+    workers = workercount(workers, total_rows)
+    rev = rev or revgen()
+    if workers == 1:
+        for chunk in chunks:
+            yield len(chunk), task(chunk, plan, version, rev)
+        return
+
+    with WorkerPool(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((len(chunk), pool.submit(task, chunk, plan, version, rev)))
+            if len(pending) >= workers * 2:  # Bound the chunks in flight
+                rows, future = pending.popleft()
+                yield rows, pool.result(future)
+        while pending:
+            rows, future = pending.popleft()
+            yield rows, pool.result(future)
+
+class WorkerPool:
+    # Worker processes for generation and batch jobs. They are spawned, not forked:
+    # spawned workers do not inherit the threads of a running Streamlit server. While
+    # instrumentation is on, tasks time themselves and result() merges their timings.
+    def __init__(self, workers):
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        self.measure = perf.enabled()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.executor.shutdown()
+
+    def submit(self, task, *args):
+        if self.measure:
+            return self.executor.submit(perf.measured, task, *args)
+        return self.executor.submit(task, *args)
+
+    def result(self, future):
+        if not self.measure:
+            return future.result()
+        value, timings = future.result()
+        perf.merge(timings)
+        return value
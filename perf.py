@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import threading
+from time import perf_counter
+from contextlib import contextmanager, nullcontext
+
+# Instrumentation: named stage timers and counters, for telling whether an export is
+# spending its time parsing, cleaning, generating or writing. Off unless enable() is
+# called or VCF_PERF is set. While off, stage() returns one shared no-op context
+# manager, iterate() returns its iterator untouched and count() returns at once; every
+# call site is per chunk, never per row, so disabled instrumentation costs nothing
+# measurable. Stages nest: each one records its total time and its own time, without
+# the stages that ran inside it. Pipeline layers are generators pulling chunks from
+# the layer below, so timing each layer's next() with iterate() gives every layer its
+# own share. Worker processes time their own chunks and hand the totals back with the
+# result (measured()), so the totals cover the whole export whichever process did the
+# work; their times add up CPU time, which can exceed the wall clock. enable() and
+# reset() act on the whole process (the CLI, worker processes); the app serves every
+# session from one process, so it times a run with collecting() instead, which keeps
+# that run's totals to its own thread.
+
+ENV = "VCF_PERF"
+NOOP = nullcontext()
+
+FROM_ENV = os.environ.get(ENV, "") not in ("", "0")
+
+class Collector:
+    __slots__ = ("stages", "counters")
+
+    def __init__(self):
+        self.stages = {}  # name -> [calls, seconds, own seconds]
+        self.counters = {}  # name -> total
+
+_enabled = FROM_ENV
+_lock = threading.Lock()
+_local = threading.local()  # stack: the running timers of this thread; collector: its collecting() run
+_process = Collector()
+
+def current():
+    return getattr(_local, "collector", None) or _process
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+def enabled():
+    return _enabled or getattr(_local, "collector", None) is not None
+
+def reset():
+    collector = current()
+    with _lock:
+        collector.stages.clear()
+        collector.counters.clear()
+
+@contextmanager
+def collecting(on=True):
+    # Instrumentation for one run in this thread only, into a collector of its own;
+    # the thread's previous state comes back on the way out, also when the run fails
+    if not on:
+        yield None
+        return
+    previous = getattr(_local, "collector", None)
+    _local.collector = Collector()
+    try:
+        yield _local.collector
+    finally:
+        _local.collector = previous
+
+class Timer:
+    __slots__ = ("name", "start", "inner")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _local.__dict__.setdefault("stack", []).append(self)
+        self.inner = 0.0
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].inner += elapsed
+        add(self.name, elapsed, elapsed - self.inner)
+
+def stage(name):
+    return Timer(name) if enabled() else NOOP
+
+def add(name, seconds, own=None, calls=1):
+    stages = current().stages
+    with _lock:
+        entry = stages.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+        entry[2] += seconds if own is None else own
+
+def count(name, amount=1):
+    if enabled():
+        counters = current().counters
+        with _lock:
+            counters[name] = counters.get(name, 0) + amount
+
+def iterate(name, items):
+    # The items of an iterator, with the time spent producing each one added to stage `name`
+    return timed(name, items) if enabled() else items
+
+def timed(name, items):
+    items = iter(items)
+    done = object()
+    while True:
+        with Timer(name):
+            item = next(items, done)
+        if item is done:
+            return
+        yield item
+
+def snapshot():
+    collector = current()
+    with _lock:
+        return {"stages": {name: {"calls": calls, "seconds": seconds, "own": own} for name, (calls, seconds, own) in collector.stages.items()}, "counters": dict(collector.counters)}
+
+def merge(data):
+    for name, entry in data["stages"].items():
+        add(name, entry["seconds"], entry["own"], entry["calls"])
+    counters = current().counters
+    with _lock:
+        for name, amount in data["counters"].items():
+            counters[name] = counters.get(name, 0) + amount
+
+def measured(task, *args):
+    # Runs task in a worker process with instrumentation on; returns (result, timings)
+    enable()
+    reset()
+    result = task(*args)
+    return result, snapshot()
+
+def rows():
+    # Stages as table rows, most own time first, and the counters
+    data = snapshot()
+    stages = sorted(data["stages"].items(), key=lambda item: -item[1]["own"])
+    table = [{"Stage": name, "Calls": entry["calls"], "Own seconds": round(entry["own"], 4), "Total seconds": round(entry["seconds"], 4), "ms per call": round(1000 * entry["seconds"] / entry["calls"], 3) if entry["calls"] else 0.0} for name, entry in stages]
+    return table, data["counters"]
+
+def write_json(path):
+    data = snapshot()
+    if path == "-":
+        json.dump(data, sys.stderr, indent=2)
+        print(file=sys.stderr)
+        return
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
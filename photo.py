@@ -0,0 +1,166 @@
+import io
+import os
+import base64
+import hashlib
+import zipfile
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache import evict, touch
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = ImageOps = None
+
+# Contact photos. A Photo column holds the path of an image (absolute, or relative to
+# the input file's folder) or the name of an image inside a ZIP archive. With Pillow
+# installed every image is downsized to a JPEG thumbnail; without it JPEG, PNG and GIF
+# files up to MAX_RAW_BYTES are embedded as they are. Thumbnails are cached on disk
+# under the hash of the image and the thumbnail settings, so daily runs over the same
+# pictures skip decoding, and the least recently used ones are evicted once the cache
+# grows past max_bytes. The distinct images of a chunk are encoded in a thread pool
+# (Pillow releases the GIL while decoding and resizing). Encoded photos replace the
+# paths in the chunk as "TYPE:base64" before the chunk is rendered.
+
+THUMBNAIL_DIR = os.path.join(os.path.expanduser("~"), ".vcf", "thumbnails")
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+THUMBNAIL_SIZE = 256
+JPEG_QUALITY = 85
+MAX_RAW_BYTES = 256 * 1024
+MAGIC = ((b"\xff\xd8\xff", "JPEG"), (b"\x89PNG\r\n\x1a\n", "PNG"), (b"GIF87a", "GIF"), (b"GIF89a", "GIF"))
+
+def imagetype(data):
+    for magic, kind in MAGIC:
+        if data.startswith(magic):
+            return kind
+    return None
+
+def thumbnail(data, size=THUMBNAIL_SIZE):
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+class ThumbnailCache:
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self.entries())
+
+    def entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".jpg")]
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".jpg")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            touch(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        tmp = os.path.join(self.directory, f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")  # Hidden from evict()
+        with open(tmp, "wb") as file:
+            file.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                # Down to 90% of max_bytes, so the next few thumbnails do not evict again
+                self.size = evict(self.directory, self.max_bytes * 0.9)
+
+class Photos:
+    def __init__(self, base=None, archive=None, cache=None, size=THUMBNAIL_SIZE, workers=None, local=True):
+        # base: folder relative paths are read from; archive: path or file object of a ZIP
+        # of images; local=False only looks in the archive (the app never reads server paths)
+        self.base = base
+        self.cache = cache
+        self.size = size
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.local = local
+        self.lock = threading.Lock()  # One archive file object shared by the threads
+        self.archive = None
+        self.names = {}  # lower-case name in the archive, and its base name -> entry name
+        if archive is not None:
+            self.archive = zipfile.ZipFile(archive)
+            for info in self.archive.infolist():
+                if not info.is_dir():
+                    self.names[info.filename.lower()] = info.filename
+                    self.names.setdefault(posixpath.basename(info.filename).lower(), info.filename)
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+    def read(self, value):
+        if self.archive is not None:
+            name = value.replace("\\", "/").lower()
+            entry = self.names.get(name) or self.names.get(posixpath.basename(name))
+            if entry is not None:
+                with self.lock:
+                    return self.archive.read(entry)
+        if self.local:
+            path = value if self.base is None else os.path.join(self.base, value)
+            if os.path.isfile(path):
+                with open(path, "rb") as file:
+                    return file.read()
+        return None
+
+    def encode(self, value):
+        # "TYPE:base64", "" for an image that cannot be used, None when there is no such file
+        data = self.read(value)
+        if data is None:
+            return None
+        if Image is None:
+            kind = imagetype(data)
+            if kind is None or len(data) > MAX_RAW_BYTES:
+                return ""
+            return kind + ":" + base64.b64encode(data).decode("ascii")
+        key = hashlib.sha256(f"{self.size}:{JPEG_QUALITY}:".encode("ascii") + data).hexdigest()
+        thumb = self.cache.get(key) if self.cache is not None else None
+        if thumb is None:
+            try:
+                thumb = thumbnail(data, self.size)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                return ""
+            if self.cache is not None:
+                self.cache.put(key, thumb)
+        return "JPEG:" + base64.b64encode(thumb).decode("ascii")
+
+    def column(self, col, stats=None):
+        values = col.where(col.notna(), "").astype(str).str.strip()
+        unique = [value for value in values.unique().tolist() if value]
+        with ThreadPoolExecutor(self.workers) as pool:
+            encoded = dict(zip(unique, pool.map(self.encode, unique)))
+        if stats is not None:
+            for key, test in (("embedded", bool), ("missing", lambda text: text is None), ("unreadable", lambda text: text == "")):
+                stats[key] = stats.get(key, 0) + sum(1 for text in encoded.values() if test(text))
+        return values.map({value: text or "" for value, text in encoded.items()}).fillna("")
+
+def iter_photos(chunks, plan, photos, stats=None):
+    # stats: distinct images per chunk that were embedded, missing or unreadable
+    positions = [field.pos for field in plan.props if field.kind == "photo" and field.pos is not None]
+    for chunk in chunks:
+        if positions:
+            chunk = chunk.copy()
+            for pos in positions:
+                chunk.isetitem(pos, photos.column(chunk.iloc[:, pos], stats))
+        yield chunk
@@ -0,0 +1,70 @@
+import os
+import re
+import json
+import hashlib
+
+# Mapping profiles: a named assign dict (column fields with their phone/email types,
+# and the "!" constant fields) saved with the signature of the header set it was made
+# for, so the next file with the same columns is mapped without touching a widget.
+
+PROFILES_PATH = os.path.join(os.path.expanduser("~"), ".vcf", "profiles.json")
+PROFILES_VERSION = 1
+
+def headerkey(column):
+    # A header as profiles compare it: case and surrounding spaces ignored
+    return str(column).strip().lower()
+
+def headersignature(columns):
+    # Same set of headers in any order, ignoring case and surrounding spaces
+    names = sorted({headerkey(column) for column in columns})
+    return hashlib.sha256(json.dumps(names).encode("utf-8")).hexdigest()[:16]
+
+def load_profiles(path=PROFILES_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    if data.get("version") != PROFILES_VERSION:
+        return {}
+    return data["profiles"]
+
+def write_profiles(profiles, path=PROFILES_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as file:
+        json.dump({"version": PROFILES_VERSION, "profiles": profiles}, file, indent=2)
+    os.replace(tmp, path)
+
+def save_profile(name, columns, assign, path=PROFILES_PATH):
+    profiles = load_profiles(path)
+    profiles.pop(name, None)  # Re-saving moves the profile to the end, where find_profile() looks first
+    profiles[name] = {"signature": headersignature(columns), "columns": [str(column) for column in columns], "assign": {key: str(value) for key, value in assign.items()}}
+    write_profiles(profiles, path)
+    return profiles[name]
+
+def delete_profile(name, path=PROFILES_PATH):
+    profiles = load_profiles(path)
+    if profiles.pop(name, None) is None:
+        return False
+    write_profiles(profiles, path)
+    return True
+
+def find_profile(columns, path=PROFILES_PATH):
+    # Name of the most recently saved profile made for this header set, or None
+    signature = headersignature(columns)
+    matches = [name for name, profile in load_profiles(path).items() if profile["signature"] == signature]
+    return matches[-1] if matches else None
+
+def profile_mapping(profile):
+    # Back to what build_assign() takes: headerkey(column) -> field (with type) and (field,
+    # value) constants. Keys are normalized like the signature, so a file whose headers
+    # differ from the saved ones only in case or spacing finds its entries.
+    mapping = {}
+    constants = []
+    for key, value in profile["assign"].items():
+        field = re.sub(r'\d+$', '', key)
+        if field.startswith("!"):
+            constants.append((field[1:], value))
+        else:
+            mapping[headerkey(value)] = field
+    return mapping, constants
@@ -0,0 +1,63 @@
+import sys
+import time
+
+# Progress for long exports. Counts are positional (rows handed over so far, never
+# DataFrame labels) and the display callback runs at most once per `interval` seconds
+# or per `every` rows, whichever comes first, so the UI is not updated per contact.
+
+def describe(done, total, rate, eta):
+    text = f"{done:,} / {total:,} rows" if total else f"{done:,} rows"
+    if rate:
+        text += f" · {rate:,.0f} rows/s"
+    if eta is not None:
+        text += f" · ETA {int(eta) // 60}:{int(eta) % 60:02d}"
+    return text
+
+class Progress:
+    def __init__(self, total, display, interval=0.5, every=None, clock=time.monotonic):
+        self.total = total
+        self.display = display  # display(done, total, rate, eta)
+        self.interval = interval
+        self.every = every
+        self.clock = clock
+        self.start = clock()
+        self.done = 0
+        self.shown = None  # (time, done) of the last display
+
+    def update(self, done):
+        self.done = done
+        now = self.clock()
+        if self.shown is not None:
+            last, lastdone = self.shown
+            due = self.interval is not None and now - last >= self.interval
+            due = due or (self.every is not None and done - lastdone >= self.every)
+            if not due:
+                return
+        self.show(now)
+
+    def show(self, now):
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else None
+        eta = (self.total - self.done) / rate if rate and self.total else None
+        self.shown = (now, self.done)
+        self.display(self.done, self.total, rate, max(eta, 0) if eta is not None else None)
+
+    def finish(self):
+        self.done = max(self.done, self.total or 0)
+        self.show(self.clock())
+
+def streamlit_display(bar):
+    def display(done, total, rate, eta):
+        bar.progress(min(done / total, 1.0) if total else 0.0, text=describe(done, total, rate, eta))
+    return display
+
+def stream_display(stream=sys.stderr, label=""):
+    # One rewritten line on a terminal, plain lines otherwise
+    def display(done, total, rate, eta):
+        text = f"{label}{describe(done, total, rate, eta)}"
+        if stream.isatty():
+            stream.write(f"\r\033[K{text}" + ("\n" if total and done >= total else ""))
+        else:
+            stream.write(text + "\n")
+        stream.flush()
+    return display
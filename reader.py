@@ -0,0 +1,159 @@
+import perf
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+CHUNKSIZE = 10000
+FILETYPES = ["xlsx", "csv", "tsv"]
+SNAPSHOT = "snapshot"  # A snapshot.Snapshot in place of the file
+
+def filetype(filename):
+    return filename.split('.')[-1].lower()
+
+def xlsxcell(value):
+    # Same conversions pd.read_excel applies to openpyxl cells
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def xlsxframe(header, batch, dtype, start, usecols=None):
+    frame = TextParser([header] + batch, header=0, dtype=dtype, usecols=usecols).read()
+    frame.index += start  # Row positions in the sheet, like read_csv chunks
+    return frame
+
+def sheetnames(file):
+    from openpyxl import load_workbook
+    if hasattr(file, "seek"):
+        file.seek(0)
+    book = load_workbook(file, read_only=True, keep_links=False)
+    try:
+        return book.sheetnames
+    finally:
+        book.close()
+
+def iter_xlsx_rows(file, chunksize=CHUNKSIZE, sheet=None):
+    # (header, rows, start) batches of converted cell values; sheet: worksheet name, the first sheet when None
+    from openpyxl import load_workbook
+    book = load_workbook(file, read_only=True, data_only=True, keep_links=False)
+    try:
+        rows = (book.worksheets[0] if sheet is None else book[sheet]).iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [xlsxcell(value) for value in header]
+        width = len(header)
+        batch = []
+        start = 0
+        for row in rows:
+            row = [xlsxcell(value) for value in row[:width]]
+            batch.append(row + [""] * (width - len(row)))
+            if len(batch) == chunksize:
+                yield header, batch, start
+                start += len(batch)
+                batch = []
+        if batch:
+            yield header, batch, start
+    finally:
+        book.close()
+
+def positions(header, usecols):
+    # Positions of the usecols labels in a header as pandas labels it (duplicates become "A.1", ...);
+    # selecting by position keeps those labels, selecting by name would not
+    labels = {label: number for number, label in enumerate(header)}
+    return sorted(labels[column] for column in usecols)
+
+def iter_xlsx(file, chunksize=CHUNKSIZE, dtype=None, sheet=None, usecols=None):
+    keep = None
+    for header, batch, start in iter_xlsx_rows(file, chunksize, sheet):
+        if usecols is not None and keep is None:
+            keep = positions(TextParser([header], header=0).read().columns, usecols)
+        yield xlsxframe(header, batch, dtype, start, keep)
+
+def iter_raw(file, extension, chunksize=CHUNKSIZE, dtype=None, sheet=None, usecols=None):
+    # usecols: labels of the only columns to parse; the others are skipped by the parser
+    if hasattr(file, "seek"):
+        file.seek(0)
+    if extension == "xlsx":
+        yield from iter_xlsx(file, chunksize, dtype, sheet, usecols)
+    elif extension in ("csv", "tsv"):
+        sep = '\t' if extension == "tsv" else ','
+        if usecols is not None:
+            usecols = positions(pd.read_csv(file, sep=sep, nrows=0).columns, usecols)
+            if hasattr(file, "seek"):
+                file.seek(0)
+        # The context manager detaches pandas' text wrapper so the upload stays open
+        # even when the caller stops early, e.g. after reading the preview chunk
+        with pd.read_csv(file, sep=sep, chunksize=chunksize, dtype=dtype, usecols=usecols) as chunks:
+            yield from chunks
+    else:
+        raise ValueError(f"Unsupported file type: {extension}")
+
+def scan(file, extension, chunksize=CHUNKSIZE, stats=None, sheet=None):
+    if extension == SNAPSHOT:
+        return file.scan(stats)
+    columns = None
+    filled = None
+    rows = 0
+    blank = []
+    for chunk in perf.iterate("read.scan", iter_raw(file, extension, chunksize, sheet=sheet)):
+        notna = chunk.notna()
+        if columns is None:
+            columns = chunk.columns.tolist()
+            filled = notna.sum()
+        else:
+            filled = filled + notna.sum()
+        used = notna.any(axis=1).to_numpy()
+        rows += int(used.sum())
+        if not used.all():
+            blank.append(chunk.index.to_numpy()[~used])
+    if columns is None:
+        return [], 0
+    if stats is not None:
+        stats["filled"] = {column: int(filled[column]) for column in columns if filled[column]}  # Non-empty cells per column
+        stats["blank"] = np.concatenate(blank) if blank else np.empty(0, dtype=np.int64)  # Positions of the empty rows, for iter_chunks()
+    return [column for column in columns if filled[column]], rows
+
+def dropblank(chunk, blank):
+    # Drops the rows at the sorted positions in blank
+    start, stop = np.searchsorted(blank, [chunk.index[0], chunk.index[-1] + 1])
+    return chunk.drop(blank[start:stop]) if stop > start else chunk
+
+def iter_chunks(file, extension, columns, chunksize=CHUNKSIZE, text=(), stats=None, sheet=None, usecols=None, blank=None):
+    # usecols: the only columns to load, default all of columns. A row is kept when any of
+    # columns is filled: blank, the empty rows found by scan(), tells which rows those are
+    # when only some columns are loaded; without it rows empty in the loaded columns are dropped.
+    if extension == SNAPSHOT:
+        chunks = file.iter_chunks(usecols or columns, chunksize, text)  # Only non-empty rows are stored
+    else:
+        chunks = iter_raw(file, extension, chunksize, {column: str for column in text} or None, sheet, usecols)  # Text: e.g. phone numbers, kept out of float
+    for chunk in perf.iterate("read.parse", chunks):
+        if extension != SNAPSHOT:
+            with perf.stage("read.clean"):
+                chunk = chunk[usecols or columns]  # Remove empty columns found by scan()
+                if blank is None:
+                    chunk = chunk.dropna(how='all')  # Remove rows that are completely empty
+                elif len(chunk):
+                    chunk = dropblank(chunk, blank)
+        if stats is not None:
+            stats["rows"] = stats.get("rows", 0) + len(chunk)
+        perf.count("rows.read", len(chunk))
+        if len(chunk):
+            yield chunk
+
+def sample(file, extension, columns, rows=100, sheet=None):
+    # The first rows, for guessing the field of columns whose header says nothing
+    return next(iter_chunks(file, extension, columns, chunksize=rows, sheet=sheet), pd.DataFrame(columns=columns))
+
+def read_rows(file, extension, columns, start, count, chunksize=CHUNKSIZE):
+    # Rows start..start + count of the non-empty rows, reading no further than needed
+    seen = 0
+    parts = []
+    for chunk in iter_chunks(file, extension, columns, chunksize):
+        if seen + len(chunk) > start:
+            parts.append(chunk.iloc[max(start - seen, 0):start + count - seen])
+            if sum(len(part) for part in parts) >= count:
+                break
+        seen += len(chunk)
+    return pd.concat(parts) if parts else pd.DataFrame(columns=columns)
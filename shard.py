@@ -0,0 +1,107 @@
+import os
+import re
+import time
+import zipfile
+import tempfile
+
+# Sharded output: cards are split into .vcf files of at most max_contacts cards or
+# max_bytes bytes, optionally one series of files per value of a group column, and
+# written into a ZIP archive as they arrive. Without grouping the current shard is
+# streamed straight into its ZIP entry. ZipFile can only have one entry open at a
+# time, so with grouping each group's current shard is spooled to a temporary file
+# and copied into the archive once it is full. Only one chunk of cards is ever
+# held in memory.
+
+UNGROUPED = "Ungrouped"
+
+def shardlabel(value):
+    label = re.sub(r"[^\w.-]+", "_", str(value)).strip("._")[:60]
+    return label or UNGROUPED
+
+def parsesize(text):
+    # "500000", "500K", "5M", "1.5MB" -> bytes
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"not a size: {text!r}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMG".index(unit.upper() or " "))
+
+class ShardWriter:
+    def __init__(self, file, stem, max_contacts=None, max_bytes=None):
+        self.archive = zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED)
+        self.stem = stem
+        self.max_contacts = max_contacts
+        self.max_bytes = max_bytes
+        self.current = {}  # group -> shard being filled
+        self.numbers = {}  # group -> shards started
+        self.shards = []  # (name, contacts, bytes) of every finished shard
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, cards, groups=None):
+        for card, group in zip(cards, groups if groups is not None else [None] * len(cards)):
+            if group is not None:
+                group = shardlabel(group)
+            shard = self.current.get(group)
+            if shard is not None and self.full(shard, len(card)):
+                self.finish(group)
+                shard = None
+            if shard is None:
+                shard = self.start(group)
+            shard["pending"].append(card)
+            shard["contacts"] += 1
+            shard["bytes"] += len(card)
+        for shard in self.current.values():
+            self.flush(shard)
+
+    def full(self, shard, size):
+        if not shard["contacts"]:
+            return False  # A card larger than max_bytes still gets a shard of its own
+        if self.max_contacts and shard["contacts"] >= self.max_contacts:
+            return True
+        return bool(self.max_bytes) and shard["bytes"] + size > self.max_bytes
+
+    def start(self, group):
+        number = self.numbers.get(group, 0) + 1
+        self.numbers[group] = number
+        name = "_".join([self.stem] + ([group] if group is not None else []) + [f"{number:03d}"]) + ".vcf"
+        shard = {"name": name, "contacts": 0, "bytes": 0, "pending": []}
+        if group is None:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            shard["out"] = self.archive.open(info, "w", force_zip64=True)
+        else:
+            handle, shard["path"] = tempfile.mkstemp(suffix=".vcf")
+            os.close(handle)
+        self.current[group] = shard
+        return shard
+
+    def flush(self, shard):
+        if not shard["pending"]:
+            return
+        if "out" in shard:
+            shard["out"].writelines(shard["pending"])
+        else:
+            with open(shard["path"], "ab") as out:
+                out.writelines(shard["pending"])
+        shard["pending"] = []
+
+    def finish(self, group):
+        shard = self.current.pop(group)
+        self.flush(shard)
+        if "out" in shard:
+            shard["out"].close()
+        else:
+            self.archive.write(shard["path"], shard["name"])
+            os.remove(shard["path"])
+        self.shards.append((shard["name"], shard["contacts"], shard["bytes"]))
+
+    def close(self):
+        for group in list(self.current):
+            self.finish(group)
+        self.archive.close()
+        return self.shards
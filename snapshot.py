@@ -0,0 +1,175 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from cache import contenthash, evict, touch
+from reader import CHUNKSIZE, iter_xlsx_rows, xlsxframe
+
+# Columnar snapshots of workbooks. Reading .xlsx through openpyxl is by far the slowest
+# step, and the same workbook is converted again and again, so the first read also
+# writes the sheet into a snapshot keyed by the content hash: one .npz part per chunk,
+# holding the non-empty rows with one array per column. Numbers keep their NumPy
+# arrays; text is stored as one NUL-joined UTF-8 buffer per column, so nothing is
+# pickled and loading a column is a decode and a split. Each column whose parsed values
+# are not plain strings also keeps its cell text, for columns read as text (phone
+# numbers). Later loads, previews and generation read only the columns they ask for.
+# Snapshots live in SNAPSHOT_DIR and the least recently used are removed once they
+# take more than MAX_SNAPSHOT_BYTES.
+
+SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".vcf", "snapshots")
+MAX_SNAPSHOT_BYTES = 1024 * 1024 * 1024
+SNAPSHOT_VERSION = 1
+INT, FLOAT = 1, 2  # Codes of numbers held in text columns; everything else is kept as its text
+
+def packtext(values):
+    # (buffer, fixed-width array or None); the fixed-width fallback is for values holding a NUL
+    joined = "\x00".join(values)
+    if joined.count("\x00") != max(len(values) - 1, 0):
+        return None, np.array(values, dtype=str)
+    return np.frombuffer(joined.encode("utf-8"), dtype=np.uint8), None
+
+def unpacktext(part, name, count):
+    if name + "u" in part:
+        return part[name + "u"].tolist()
+    return part[name].tobytes().decode("utf-8").split("\x00") if count else []
+
+def addtext(arrays, name, col):
+    # Strings of an object column, with a mask of missing cells and codes for numbers
+    missing = col.isna().to_numpy()
+    values = [value if isinstance(value, str) else str(value) for value in col.where(~missing, "").tolist()]
+    buffer, fixed = packtext(values)
+    if fixed is None:
+        arrays[name] = buffer
+    else:
+        arrays[name + "u"] = fixed
+    arrays[name + "m"] = missing
+    codes = np.array([INT if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)) else FLOAT if isinstance(value, (float, np.floating)) else 0 for value in col.tolist()], dtype=np.uint8)
+    if codes.any():
+        arrays[name + "c"] = codes
+
+def plainstrings(col):
+    return col.dtype == object and all(isinstance(value, str) for value in col.dropna().tolist())
+
+def loadtext(part, name, count):
+    values = np.array(unpacktext(part, name, count), dtype=object)
+    values[part[name + "m"]] = np.nan
+    if name + "c" in part:
+        codes = part[name + "c"]
+        for code, convert in ((INT, int), (FLOAT, float)):
+            selected = codes == code
+            if selected.any():
+                values[selected] = [convert(value) for value in values[selected]]
+    return values
+
+def labelsok(labels):
+    return all(isinstance(label, str) or isinstance(label, int) and not isinstance(label, bool) for label in labels)
+
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            self.meta = json.load(file)
+        touch(path)
+        self.positions = {label: number for number, label in enumerate(self.meta["all"])}
+
+    def scan(self, stats=None):
+        if stats is not None:
+            stats["filled"] = {label: count for label, count in self.meta["filled"]}
+        return list(self.meta["columns"]), self.meta["rows"]
+
+    def iter_chunks(self, columns, chunksize=CHUNKSIZE, text=()):
+        # Non-empty rows with only `columns`; columns in `text` get their cell text
+        for number in range(self.meta["parts"]):
+            with np.load(os.path.join(self.path, f"part-{number:05d}.npz"), allow_pickle=False) as part:
+                index = part["index"]
+                count = len(index)
+                data = {}
+                for column in columns:
+                    name = str(self.positions[column])
+                    if column in text and "r" + name + "m" in part:
+                        data[column] = loadtext(part, "r" + name, count)
+                    elif "t" + name in part:
+                        data[column] = part["t" + name].view(str(part["d" + name])) if "d" + name in part else part["t" + name]
+                    else:
+                        data[column] = loadtext(part, "s" + name, count)
+            frame = pd.DataFrame(data, index=index, columns=columns)
+            for start in range(0, count, chunksize):
+                yield frame.iloc[start:start + chunksize]
+
+def partarrays(typed, text, keep):
+    arrays = {"index": typed.index.to_numpy(dtype=np.int64)[keep]}
+    for number in range(typed.shape[1]):
+        name = str(number)
+        col = typed.iloc[keep, number]
+        if col.dtype.kind in "biuf":
+            arrays["t" + name] = col.to_numpy()
+        elif col.dtype.kind == "M":
+            arrays["t" + name] = col.to_numpy().view(np.int64)
+            arrays["d" + name] = np.array(str(col.dtype))
+        else:
+            addtext(arrays, "s" + name, col)
+        if not plainstrings(col):
+            addtext(arrays, "r" + name, text.iloc[keep, number])
+    return arrays
+
+def build(file, path, sheet=None, chunksize=CHUNKSIZE):
+    # Writes the snapshot of one sheet to path; False when the sheet cannot be snapshotted
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    work = tempfile.mkdtemp(prefix=".build-", dir=SNAPSHOT_DIR)
+    try:
+        labels = None
+        filled = None
+        rows = 0
+        parts = 0
+        for header, batch, start in iter_xlsx_rows(file, chunksize, sheet):
+            typed = xlsxframe(header, batch, None, start)
+            if labels is None:
+                labels = typed.columns.tolist()
+                if not labelsok(labels):
+                    return False  # Headers that are dates or fractions do not survive JSON
+                filled = np.zeros(len(labels), dtype=np.int64)
+            text = xlsxframe(header, batch, {label: str for label in labels}, start)
+            notna = typed.notna()
+            filled += notna.sum().to_numpy()
+            keep = notna.any(axis=1).to_numpy()
+            rows += int(keep.sum())
+            np.savez(os.path.join(work, f"part-{parts:05d}.npz"), **partarrays(typed, text, keep))
+            parts += 1
+        if labels is None:
+            labels, filled = [], []  # An empty sheet
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "all": labels,
+            "columns": [label for label, count in zip(labels, filled) if count],
+            "filled": [[label, int(count)] for label, count in zip(labels, filled) if count],
+            "rows": rows,
+            "parts": parts,
+        }
+        with open(os.path.join(work, "meta.json"), "w", encoding="utf-8") as out:
+            json.dump(meta, out)
+        try:
+            os.rename(work, path)
+        except OSError:
+            pass  # Built by another process in the meantime
+        return True
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def snapshotkey(filehash, sheet=None):
+    return contenthash(json.dumps([filehash, sheet, CHUNKSIZE, SNAPSHOT_VERSION]).encode("utf-8"))
+
+def open_snapshot(file, filehash, sheet=None):
+    # The snapshot of a workbook's sheet, built on first use; None if it cannot be made
+    path = os.path.join(SNAPSHOT_DIR, snapshotkey(filehash, sheet))
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        if hasattr(file, "seek"):
+            file.seek(0)
+        if not build(file, path, sheet):
+            return None
+        evict(SNAPSHOT_DIR, MAX_SNAPSHOT_BYTES, keep=path)
+    try:
+        return Snapshot(path)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,41 @@
+import pandas as pd
+from vcard import compile_assign, gen_vcards
+from dedup import EXTRA_COLUMN, MAX_SHARED, find_groups, iter_dedup, with_extra
+
+ASSIGN = {"Name1": "Name", "Phone Number+Mobile2": "Phone", "Email+Work3": "Email"}
+
+def dedup(df, chunksize=2):
+    assign = with_extra(ASSIGN)
+    plan = compile_assign(assign, list(df.columns) + [EXTRA_COLUMN])
+    chunks = [df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize)]
+    stats = {}
+    groups = find_groups(chunks, plan, stats=stats)
+    out = pd.concat(list(iter_dedup(chunks, plan, groups, stats=stats)))
+    return out, stats, gen_vcards(out, plan, "3.0", "20240101T000000Z")
+
+def test_rows_sharing_a_number_or_address_merge_across_chunks():
+    df = pd.DataFrame({
+        "Name": ["Ann", None, "Bo", "Ann L"],
+        "Phone": ["9876543210", "9876543210", "9123456789", "9000000001"],
+        "Email": [None, "Ann@X.com", None, "ann@x.com"],
+    })
+    out, stats, cards = dedup(df)
+    assert stats["groups"] == 1 and stats["merged"] == 2
+    assert list(out.index) == [2, 3]  # The merged card comes where its last row was
+    assert cards.count("BEGIN:VCARD") == 2
+    assert "TEL;TYPE=CELL:9000000001\n" in cards and "EMAIL;TYPE=WORK:Ann@X.com\n" in cards
+
+def test_placeholders_do_not_merge():
+    df = pd.DataFrame({
+        "Name": ["A", "B", "C", "D"],
+        "Phone": ["0000000000", "0000000000", "123", "123"],
+        "Email": ["na@na.com", "na@na.com", None, None],
+    })
+    _, stats, _ = dedup(df)
+    assert stats["groups"] == 0
+
+def test_values_shared_by_too_many_rows_are_ignored():
+    rows = MAX_SHARED + 1
+    df = pd.DataFrame({"Name": [f"P{number}" for number in range(rows)], "Phone": ["9876543210"] * rows, "Email": [None] * rows})
+    _, stats, _ = dedup(df)
+    assert stats["groups"] == 0 and stats["ignored"] == 1
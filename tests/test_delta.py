@@ -0,0 +1,35 @@
+import pandas as pd
+from vcard import compile_assign
+from delta import UID_COLUMN, iter_delta, load_index, with_uid
+
+ASSIGN = {"Name1": "Name", "Phone Number+Mobile2": "Phone"}
+
+def export(rows, index):
+    df = pd.DataFrame(rows, columns=["Name", "Phone"])
+    assign = with_uid(ASSIGN)
+    plan = compile_assign(assign, list(df.columns) + [UID_COLUMN])
+    stats = {}
+    chunks = list(iter_delta([df], plan, index, "settings", stats=stats))
+    uids = dict(zip(chunks[0]["Phone"], chunks[0][UID_COLUMN])) if chunks else {}
+    return uids, stats
+
+def test_same_name_keeps_uid_when_the_other_is_removed():
+    index = load_index(None)
+    first, _ = export([["Ann Lee", "111"], ["Ann Lee", "222"]], index)
+    _, stats = export([["Ann Lee", "222"]], index)
+    assert stats["unchanged"] == 1
+    assert stats["removed"] == [first["111"]]
+
+def test_reordered_rows_are_unchanged():
+    index = load_index(None)
+    export([["Ann Lee", "111"], ["Ann Lee", "222"]], index)
+    changed, stats = export([["Ann Lee", "222"], ["Ann Lee", "111"]], index)
+    assert changed == {}
+    assert stats["unchanged"] == 2 and stats["removed"] == []
+
+def test_changed_number_keeps_uid():
+    index = load_index(None)
+    first, _ = export([["Ann Lee", "111"], ["Bob Roy", "222"]], index)
+    changed, stats = export([["Ann Lee", "333"], ["Bob Roy", "222"]], index)
+    assert changed == {"333": first["111"]}
+    assert stats["changed"] == 1 and stats["new"] == 0 and stats["removed"] == []
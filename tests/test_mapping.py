@@ -0,0 +1,50 @@
+import pytest
+from utils import columnfield
+
+@pytest.mark.parametrize("header, field", [
+    ("Primary Mobile No", "Phone Number+Mobile"),
+    ("Company Phone", "Phone Number+Work"),
+    ("Residence Phone", "Phone Number+Home"),
+    ("Work Email", "Email+Work"),
+    ("E-mail", "Email"),
+    ("Email ID", "Email"),
+    ("Contact Person Name", "Name"),
+    ("Adress", "Address"),
+    ("Emial", "Email"),
+    ("Orgnization", "Organization"),
+    ("Other Email", "Email+Other"),
+    ("Other Phone", "Phone Number"),
+])
+def test_headers_that_map(header, field):
+    assert columnfield(header) == field
+
+@pytest.mark.parametrize("header", [
+    "Company Address", "Father Name", "Mother's Name", "Username", "Rule",
+    "Email Sent", "Phone Verified", "Phone Type", "Org Id", "Employee ID",
+])
+def test_headers_left_unmapped(header):
+    assert columnfield(header) == "NONE"
+
+def test_inferred_subtypes_are_offered_by_the_widgets():
+    from utils import COLUMNOPTIONS, TYPEOPTIONS
+    for header in ["Other Email", "Work Email", "Home Phone", "Personal Mobile", "Office Email"]:
+        field, _, subtype = columnfield(header).partition("+")
+        assert field in COLUMNOPTIONS and (not subtype or subtype in TYPEOPTIONS[field])
+
+def test_values_decide_only_for_generic_headers():
+    phones = ["98765 43210", "+91 98765-43210", "9123456789"]
+    assert columnfield("Unnamed: 4", phones) == "Phone Number"
+    assert columnfield("Aadhaar", ["1234 5678 9012", "2345 6789 0123"]) == "NONE"
+
+def test_dates_are_not_phone_numbers():
+    assert columnfield("Unnamed: 3", ["1990-01-02", "01/02/2020", "2020.11.12"]) == "NONE"
+
+def test_profile_found_and_applied_despite_header_case(tmp_path):
+    from profiles import find_profile, headerkey, load_profiles, profile_mapping, save_profile
+    path = str(tmp_path / "profiles.json")
+    save_profile("people", ["Full Name", "Mobile No."], {"Name1": "Full Name", "Phone Number+Mobile2": "Mobile No."}, path=path)
+    columns = [" full name", "MOBILE NO."]
+    name = find_profile(columns, path=path)
+    assert name == "people"
+    known, _ = profile_mapping(load_profiles(path)[name])
+    assert [known.get(headerkey(column)) for column in columns] == ["Name", "Phone Number+Mobile"]
@@ -0,0 +1,27 @@
+import threading
+import pytest
+import perf
+
+def test_collecting_keeps_a_run_to_its_thread():
+    seen = {}
+
+    def other():
+        seen["enabled"] = perf.enabled()
+        with perf.stage("other"):
+            pass
+
+    with perf.collecting():
+        with perf.stage("mine"):
+            pass
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        stages = perf.snapshot()["stages"]
+    assert list(stages) == ["mine"]
+    assert seen["enabled"] == perf.FROM_ENV
+
+def test_collecting_is_undone_when_the_run_fails():
+    with pytest.raises(ValueError):
+        with perf.collecting():
+            raise ValueError
+    assert perf.enabled() == perf.FROM_ENV
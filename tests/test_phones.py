@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+from utils import normalize_phones, phonedigits
+
+# The row and column paths must agree, and a number that already starts with the
+# country code must not get it twice.
+
+CASES = [
+    ("919876543210", "91", "+919876543210"),
+    ("9876543210", "91", "+919876543210"),
+    ("09876543210", "91", "+919876543210"),
+    ("9198765432", "91", "+919198765432"),  # A national number that starts with 91
+    ("15551234567", "1", "+15551234567"),
+    ("5551234567", "1", "+15551234567"),
+    ("+44 20 7946 0958", "91", "+442079460958"),
+    ("0044 20 7946 0958", "91", "+442079460958"),
+    ("353871234567", "353", "+353871234567"),
+    ("871234567", "353", "+353871234567"),
+    ("", "91", ""),
+]
+
+@pytest.mark.parametrize("number, country_code, expected", CASES)
+def test_phonedigits(number, country_code, expected):
+    assert phonedigits(number, country_code) == expected
+
+@pytest.mark.parametrize("country_code", ["91", "+1", "353"])
+def test_normalize_phones_matches_phonedigits(country_code):
+    numbers = pd.Series([number for number, _, _ in CASES])
+    expected = [phonedigits(number, country_code) for number in numbers]
+    assert normalize_phones(numbers, country_code).tolist() == expected
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from vcard import compile_assign, gen_vcard, gen_vcards
+
+# gen_vcards must write exactly what gen_vcard writes row by row, whatever the
+# column dtypes: the per-row path is the reference the batch engine reproduces.
+
+REV = "20240101T000000Z"
+
+FRAMES = {
+    "mixed": pd.DataFrame({
+        "Name": ["  Ann ", "", None, "Bo Li"],
+        "Phone": [9876543210.0, np.nan, 12.5, 1e16],
+        "Mail": ["a@x.com", None, "c", "d@y.org"],
+        "Org": ["X", "", "Y", None],
+    }),
+    "numeric": pd.DataFrame({"First": [1, 2, 3], "Last": [1.5, 2.0, np.nan]}),
+    "bool_datetime": pd.DataFrame({
+        "First": ["a", "b"],
+        "When": pd.to_datetime(["2020-01-01 00:00", "2021-02-03 04:05"]),
+        "Flag": [True, False],
+    }),
+    "object_phones": pd.DataFrame({
+        "Name": ["Jo", "Zoë", "A;b,c", None],
+        "Phone": ["+91 98765-43210", 12.34, None, 5],
+        "Email": ["e@x.com", "", None, "f@x.com"],
+        "Suffix": ["Jr", "", None, "Sr"],
+    }),
+}
+
+FIELDS = ["Name", "Phone Number+Work", "Email+Home", "Organization", "Suffix"]
+
+def assign_for(columns):
+    assign = {f"{field}{number}": column for number, (field, column) in enumerate(zip(FIELDS, columns), 1)}
+    assign["!NOTE9"] = " constant "
+    assign["!Phone Number+Home10"] = "12.3"
+    return assign
+
+def rowwise(df, plan, version):
+    return "".join(gen_vcard(plan, row, version, REV) for _, row in df.iterrows())
+
+@pytest.mark.parametrize("name", sorted(FRAMES))
+@pytest.mark.parametrize("version", ["2.1", "3.0"])
+@pytest.mark.parametrize("country_code", [None, "91"])
+def test_gen_vcards_matches_gen_vcard(name, version, country_code):
+    df = FRAMES[name]
+    plan = compile_assign(assign_for(df.columns), df.columns, country_code)
+    assert gen_vcards(df, plan, version, REV) == rowwise(df, plan, version)
+
+def test_wide_frame_keeps_fields_past_ten_columns():
+    df = pd.DataFrame({f"c{number}": [f"v{number}"] for number in range(12)})
+    assign = {"Name1": "c0", "Organization12": "c11", "Phone Number+Work11": "c10"}
+    cards = gen_vcards(df, assign, "3.0", REV)
+    assert "ORG:v11\n" in cards
+    assert "TEL;TYPE=WORK:" in cards
+
+def test_empty_frame():
+    assert gen_vcards(pd.DataFrame({"A": []}), {"Name1": "A"}, "3.0", REV) == ""
+
+def test_quoted_printable_never_starts_a_line_with_whitespace():
+    from vcardspec import quoted
+    value = "a" * 40 + " " * 60 + "\tb"
+    lines = quoted(value, used=30).split("\r\n")
+    assert all(line.endswith("=") for line in lines[:-1])
+    assert not any(line[:1] in (" ", "\t") for line in lines[1:])
+    assert max(len(line) for line in lines[1:]) <= 76
@@ -0,0 +1,18 @@
+import io
+from vcfparser import iter_lines, iter_records
+
+def lines(text):
+    return list(iter_lines(io.BytesIO(text.encode("utf-8"))))
+
+def test_folded_line_is_joined():
+    assert lines("BEGIN:VCARD\r\nNOTE:long\r\n  text\r\nEND:VCARD\r\n")[1] == "NOTE:long text"
+
+def test_soft_break_keeps_a_leading_space():
+    text = "BEGIN:VCARD\r\nNOTE;ENCODING=QUOTED-PRINTABLE:one word=\r\n two\r\nEND:VCARD\r\n"
+    assert lines(text)[1] == "NOTE;ENCODING=QUOTED-PRINTABLE:one word two"
+
+def test_bare_quoted_printable_parameter_is_decoded():
+    text = "BEGIN:VCARD\r\nVERSION:2.1\r\nN:Lee;Ann\r\nTEL;CELL;QUOTED-PRINTABLE:=2B91 98765=2043210\r\nNOTE;CHARSET=UTF-8;QUOTED-PRINTABLE:caf=C3=A9\r\nEND:VCARD\r\n"
+    record = next(iter_records(io.BytesIO(text.encode("utf-8"))))
+    assert record["Mobile"] == "+91 98765 43210"
+    assert record["Note"] == "café"
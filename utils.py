@@ -1,32 +1,102 @@
 import time
 import re
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger("vcf")
 
 def revgen():
     t = time.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"Current time: {t}")
+    logger.debug("Current time: %s", t)
     t = t.replace(":","")
     t= t.replace(" ","T")
     t = t.replace("-","")
     t = t+"Z"
     return t
 
-def genrev():
-    return f"REV:{revgen()}\n"
+def genrev(rev=None):
+    # Pass one revgen() result for a whole export so every card shares it
+    return f"REV:{rev or revgen()}\n"
 
-def genphn(phn,number):
-    number = str(number)
-    number = number.strip()
-    if "." in number:
-        number = number.split(".")[0]
-    number = re.sub(r'[^0-9]', '', number)  # Remove non-numeric characters
-    if phn == "Phone Number+Mobile":
-        return f"TEL;TYPE=CELL:{number}\n"
-    elif phn == "Phone Number+Work":
-        return f"TEL;TYPE=WORK:{number}\n"
-    elif phn == "Phone Number+Home":
-        return f"TEL;TYPE=HOME:{number}\n"
+PHONE_TYPES = {"Phone Number+Mobile": "CELL", "Phone Number+Work": "WORK", "Phone Number+Home": "HOME"}
+EMAIL_TYPES = {"Email+Work": "WORK", "Email+Home": "HOME", "Email+Other": "OTHER"}
+NONDIGIT = re.compile(r'[^0-9]')
+# Digits of a national number (without trunk 0) for common calling codes, to tell
+# 919876543210 (already international) from a national number starting with 91.
+# Numbers of other codes are taken as international when longer than LONGEST_NATIONAL.
+NATIONAL_DIGITS = {
+    "1": (10,), "7": (10,), "20": (10,), "27": (9,), "31": (9,), "33": (9,), "34": (9,),
+    "39": (9, 10), "44": (10,), "49": (10, 11), "52": (10,), "55": (10, 11), "61": (9,),
+    "62": (9, 10, 11), "63": (10,), "65": (8,), "66": (9,), "81": (10,), "82": (9, 10),
+    "86": (11,), "90": (10,), "91": (10,), "92": (10,), "234": (10,), "880": (10,),
+    "966": (9,), "971": (9,),
+}
+LONGEST_NATIONAL = 10
+
+def typeprefix(prop, typ):
+    if typ:
+        return f"{prop};TYPE={typ}:"
+    return f"{prop}:"
+
+def phonetext(number):
+    if isinstance(number, float):
+        return str(number).split(".")[0]  # Undo pandas reading the column as float
+    return str(number).strip()
+
+def phonee164(number, digits, country_code):
+    country_code = str(country_code).lstrip("+")
+    if not digits:
+        return ""
+    if number.lstrip().startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    national = digits.lstrip("0")
+    if carriescode(national, country_code):
+        return "+" + national
+    return "+" + country_code + national
+
+def carriescode(national, country_code):
+    # Whether digits starting with the country code are too long to be a national number
+    if not national.startswith(country_code):
+        return False
+    lengths = NATIONAL_DIGITS.get(country_code)
+    if lengths is None:
+        return len(national) > LONGEST_NATIONAL
+    return len(national) not in lengths and len(national) - len(country_code) in lengths
+
+def phonedigits(number, country_code=None):
+    number = phonetext(number)
+    digits = NONDIGIT.sub('', number)  # Remove non-numeric characters
+    if country_code:
+        return phonee164(number, digits, country_code)
+    return digits
+
+def normalize_phones(numbers, country_code=None):
+    # Column version of phonedigits() for a Series of phone numbers read as text
+    digits = numbers.str.replace(NONDIGIT, '', regex=True)
+    if not country_code:
+        return digits
+    country_code = str(country_code).lstrip("+")
+    national = digits.str.lstrip("0")
+    out = "+" + country_code + national
+    out = out.mask(carriescodes(national, country_code), "+" + national)
+    out = out.mask(digits.str.startswith("00"), "+" + digits.str[2:])
+    out = out.mask(numbers.str.lstrip().str.startswith("+"), "+" + digits)
+    return out.mask(digits == "", "")
+
+def carriescodes(national, country_code):
+    # Column version of carriescode()
+    length = national.str.len()
+    lengths = NATIONAL_DIGITS.get(country_code)
+    if lengths is None:
+        longer = length > LONGEST_NATIONAL
     else:
-        return f"TEL:{number}\n"
+        longer = ~length.isin(lengths) & (length - len(country_code)).isin(lengths)
+    return national.str.startswith(country_code) & longer
+
+def genphn(phn,number):
+    return f"{typeprefix('TEL', PHONE_TYPES.get(phn))}{phonedigits(number)}\n"
     
 def gennote(note):
     if note:
@@ -41,14 +111,7 @@ def genorg(organization):
         return "\n"
 
 def genemail(email_type, email):
-    if email_type == "Email+Work":
-        return f"EMAIL;TYPE=WORK:{email}\n"
-    elif email_type == "Email+Home":
-        return f"EMAIL;TYPE=HOME:{email}\n"
-    elif email_type == "Email+Other":
-        return f"EMAIL;TYPE=OTHER:{email}\n"
-    else:
-        return f"EMAIL:{email}\n"
+    return f"{typeprefix('EMAIL', EMAIL_TYPES.get(email_type))}{email}\n"
     
 def genjob(job_title):
     if job_title:
@@ -63,22 +126,15 @@ def genaddress(address):
         return "\n"
 
 def genfullname(name):
-    fn = ""
-    for i in name:
-        if i:
-            fn += i + " "
-    fn = fn.strip()
+    fn = " ".join(i for i in name if i).strip()
     if not fn:
         fn = "Unknown"
     
     return f"FN:{fn}\n"
 
 def genname(name,suffix):
-    name = " ".join(name)
-    name = name.strip()
-    name = name + ";;;;"
-    name = name+ " ".join(suffix)
-    return f"N:{name}\n"
+    name = " ".join(name).strip()
+    return f"N:{name};;;;{' '.join(suffix)}\n"
 
 def textedit(text):
     if text:
@@ -87,35 +143,185 @@ def textedit(text):
     else:
         return ""
 
+COLUMNOPTIONS = ["NONE","Address", "Name", "Phone Number", "Email","Suffix","Organization", "Job Title","NOTE","Photo"]
+# Subtypes the mapping widgets offer, the first one the default (an Email+Mobile column
+# is a plain EMAIL line); columnfield() infers no others
+TYPEOPTIONS = {"Phone Number": ["Mobile", "Work", "Home"], "Email": ["Mobile", "Work", "Home", "Other"]}
+SYNONYMS = {
+    "Name": ["name","full name","fullname","contact name","first name","last name","surname","given name","family name","student name"],
+    "Address": ["address","address work","address home","hall of residence","residence","hall","home address","work address","office address","location","place of residence","addr","street","postal address"],
+    "Phone Number": ["phone number","phone","mobile","ph no","mobile number","cell","home phone","work phone","business phone","business fax","mobile no","phone no","contact number","contact no","telephone","tel","cell phone","cellphone","whatsapp","whatsapp number","landline","fax","mob","mob no"],
+    "Email": ["email","email work","email home","email other","email personal","gmail","outlook","yahoo","hotmail","icloud","mail","work mail","personal mail","mailid","email id","email address","mail id","e mail","e mail id","mail address"],
+    "Organization": ["company","organization","org","company name","organization name","org name","organisation","institute","institution","employer","firm","college","university"],
+    "NOTE": ["note","department","notes","comment","comments","description","remarks","feedback","observation","annotation","branch","dept","remark"],
+    "Job Title": ["job title","job","designation","position","role","occupation","profession","work title","work position"],
+    "Suffix": ["suffix","name suffix","title suffix","honorific suffix","post-nominal letters","post-nominal title","post-nominal suffix"],
+    "Photo": ["photo","picture","image","avatar","profile photo","profile picture","photo path","photo file","image path","image file","headshot","pic"],
+}
+SUBTYPES = {
+    "mobile": "Mobile", "cell": "Mobile", "cellphone": "Mobile", "cellular": "Mobile", "mob": "Mobile", "whatsapp": "Mobile",
+    "work": "Work", "office": "Work", "business": "Work", "official": "Work", "company": "Work",
+    "home": "Home", "personal": "Home", "residence": "Home", "landline": "Home", "private": "Home",
+    "other": "Other",
+}
+PHONE_LIKE = re.compile(r'^\+?[\d\s().\-/]{7,20}$')
+DATE_LIKE = re.compile(r'^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}$')
+# Words that make a header about something other than the contact's own field: "Email
+# Sent", "Phone Type", "Org Id", "Father Name". Only exact synonyms map such headers.
+QUALIFIERS = {
+    "sent", "verified", "verify", "valid", "validated", "confirmed", "opt", "optin", "consent", "status", "type", "kind",
+    "id", "ids", "code", "count", "date", "time", "flag", "format", "domain", "length", "score", "source",
+    "father", "fathers", "mother", "mothers", "parent", "parents", "guardian", "spouse", "husband", "wife", "son", "daughter",
+    "emergency", "reference", "referee", "manager", "supervisor", "mentor", "nominee", "kin", "relative", "user", "username", "login", "account",
+}
+# Headers that say nothing about the values, so the values are looked at instead
+GENERIC_HEADER = re.compile(r'^((unnamed|column|col|field|value|values|data|info|details|misc|other|extra|untitled|contact|contacts)( ?\d+)?|[a-z]?\d*)$')
+EMAIL_LIKE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+IMAGE_LIKE = re.compile(r'\.(jpe?g|png|gif|bmp|webp|heic|tiff?)$', re.IGNORECASE)
+
+def normalize_header(text):
+    return " ".join(re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).split())
+
+# Precomputed once: normalized synonym -> field, plus the same synonym without spaces
+# so "E-mail", "e mail" and "email" all meet in one dictionary lookup
+COLUMN_INDEX = {}
+for _field, _names in SYNONYMS.items():
+    for _name in _names:
+        COLUMN_INDEX.setdefault(normalize_header(_name), _field)
+        COLUMN_INDEX.setdefault(normalize_header(_name).replace(" ", ""), _field)
+COLUMN_INDEX.update({option.lower(): option for option in COLUMNOPTIONS if option != "NONE"})
+MAX_PHRASE = max(len(name.split()) for name in COLUMN_INDEX)
+
+def editdistance(a, b, limit):
+    # Edit distance counting a swap of two neighbouring letters as one edit,
+    # giving up as soon as it must exceed limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y))
+            if before and i > 1 and j > 1 and x == b[j - 2] and a[i - 2] == y:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+@lru_cache(maxsize=4096)
 def columncheck(req):
-    columnoptions = ["NONE","Address", "Name", "Phone Number", "Email","Suffix","Organization", "Job Title","NOTE"]
-    if req in columnoptions:
+    if req in COLUMNOPTIONS:
         return req
-    req = req.strip()
-    req = req.lower()
-    Nameoptions = ["name","full name","name","fullname"]
-    addressoptions = ["address","address work","address home","hall of residence","residence","hall","home address","work address","office address","location","place of residence"]
-    phoneoptions = ["phone number","phone","mobile","ph no","mobile number","cell","home phone","work phone","business phone","business fax","mobile no"]
-    emailoptions = ["email","email work","email home","email other","email personal","gmail","outlook","yahoo","hotmail","icloud","mail","work mail","personal mail","mailid","email id", "email address", "mail id"]
-    companyoptions = ["company","organization","org","company name","organization name","org name"]
-    noteoptions = ["note","department","notes","comment","comments","description","remarks","feedback","observation","annotation","branch"]
-    jobtitleoptions = ["job title","job","designation","position","role","occupation","profession","work title","work position"]
-    suffixoptions = ["suffix","name suffix","title suffix","honorific suffix","post-nominal letters","post-nominal title","post-nominal suffix"]
-    if req in Nameoptions:
-        return "Name"
-    elif req in addressoptions:
-        return "Address"
-    elif req in phoneoptions:
-        return "Phone Number"
-    elif req in emailoptions:
+    words = normalize_header(req).split()
+    if not words:
+        return ''
+    found = COLUMN_INDEX.get(" ".join(words)) or COLUMN_INDEX.get("".join(words))
+    if found:
+        return found
+    if any(word in QUALIFIERS for word in words):
+        return ''
+    matches = phrases(words)
+    if matches:
+        return headfield(words, matches)
+    # Typos such as "Adress" or "Emial": closest synonym within a small edit distance
+    compact = "".join(words)
+    if len(compact) < 5:
+        return ''
+    limit = 1 if len(compact) < 10 else 2
+    best, found = limit + 1, ''
+    for name, field in COLUMN_INDEX.items():
+        if len(name) >= 4:
+            distance = editdistance(compact, name, limit)
+            if distance < best:
+                best, found = distance, field
+    return found
+
+def phrases(words):
+    # (field, start, end) of the known phrases in a header, longest first, not overlapping
+    matches = []
+    taken = [False] * len(words)
+    for size in range(min(MAX_PHRASE, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            if any(taken[start:start + size]):
+                continue
+            found = COLUMN_INDEX.get(" ".join(words[start:start + size]))
+            if found and (size > 1 or len(words[start]) > 2):
+                matches.append((found, start, start + size))
+                taken[start:start + size] = [True] * size
+    return sorted(matches, key=lambda match: match[1])
+
+def headfield(words, matches):
+    # The field of a header's phrases: the head noun (the last one) decides, and a header
+    # naming two fields maps to nothing, except phone and email headers whose other
+    # words are subtypes ("Company Phone", "Residence Phone")
+    field, start, end = matches[-1]
+    others = matches[:-1]
+    if all(other == field for other, _, _ in others):
+        return field
+    if field in ("Phone Number", "Email") and all(end - start == 1 and words[start] in SUBTYPES for _, start, end in others):
+        return field
+    return ''
+
+@lru_cache(maxsize=4096)
+def columnsubtype(req):
+    # Mobile, Work, Home or Other from words in a phone or email header, '' when none
+    for word in normalize_header(req).split():
+        if word in SUBTYPES:
+            return SUBTYPES[word]
+    return ''
+
+def samplecheck(values, threshold=0.8):
+    # Field for an unlabeled column from its values: phone-like, email-like or image file samples
+    values = [str(value).strip() for value in values if value is not None and value == value]  # Skip None and NaN
+    values = [value for value in values if value]
+    if not values:
+        return ''
+    if sum(bool(EMAIL_LIKE.match(value)) for value in values) >= threshold * len(values):
         return "Email"
-    elif req in jobtitleoptions:
-        return "Job Title"
-    elif req in companyoptions:
-        return "Organization"
-    elif req in noteoptions:
-        return "NOTE"
-    elif req in suffixoptions:
-        return "Suffix"
-    else:
-        return ''
\ No newline at end of file
+    phones = sum(bool(PHONE_LIKE.match(value)) and not DATE_LIKE.match(value) and len(NONDIGIT.sub('', value)) >= 7 for value in values)
+    if phones >= threshold * len(values):
+        return "Phone Number"
+    if sum(bool(IMAGE_LIKE.search(value)) for value in values) >= threshold * len(values):
+        return "Photo"
+    return ''
+
+def columnfield(column, sample=None):
+    # Mapping for one column: header first, then sample values; phones and emails get a subtype
+    field = columncheck(str(column))
+    if not field and sample is not None and GENERIC_HEADER.match(normalize_header(column)):
+        field = samplecheck(sample)
+    if field in ("Phone Number", "Email"):
+        subtype = columnsubtype(str(column))
+        if subtype not in TYPEOPTIONS[field]:
+            subtype = ''
+        if subtype:
+            field = f"{field}+{subtype}"
+    return field or "NONE"
+
+def automap(columns, sample=None):
+    # sample: optional DataFrame of the first rows, used for columns whose header says nothing
+    return {column: columnfield(column, None if sample is None else sample[column].head(100)) for column in columns}
+
+def build_assign(columns, mapping, constants=()):
+    # Same keys main.main() builds from the mapping widgets
+    assign = {}
+    ind = 0
+    for column in columns:
+        ind += 1
+        value = mapping.get(column) or "NONE"
+        if value == "Phone Number" or value == "Email":
+            value = value + "+Mobile"
+        if value != "NONE":
+            assign[value + str(ind)] = column
+    for field, value in constants:
+        ind += 1
+        if value:
+            assign["!" + field + str(ind)] = value
+    return assign
+
+def mappedcolumns(columns, assign, extra=()):
+    # The columns assign reads (constants aside) and those in extra, in file order
+    wanted = {column for key, column in assign.items() if not key.startswith("!")} | set(extra)
+    return [column for column in columns if column in wanted]
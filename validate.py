@@ -0,0 +1,105 @@
+import io
+import csv
+import json
+import pandas as pd
+from vcard import phonecolumn
+from utils import EMAIL_LIKE
+
+# Data-quality checks that run on each chunk on its way to the generator, so no extra
+# pass over the file is needed. Every check is a vectorized test over one mapped
+# column; the report keeps a count and the first row numbers for each kind of issue.
+# Invalid rows can be kept (report only), skipped, or skipped and written to a
+# quarantine CSV with their row number and issues.
+
+ISSUES = {
+    "empty_name": "No name: the card is saved as \"Unknown\"",
+    "invalid_phone": "Phone number without any digits",
+    "invalid_email": "Email address that is not name@domain",
+}
+ROW_COLUMN = "Row"
+ISSUES_COLUMN = "Issues"
+SAMPLE_ROWS = 20
+
+def new_report():
+    return {"rows": 0, "invalid": 0, "issues": {issue: {"count": 0, "rows": []} for issue in ISSUES}}
+
+def filled(col):
+    return col.notna() & (col.astype(str).str.strip() != "")
+
+def check(chunk, plan):
+    # issue -> boolean Series over the chunk's rows
+    issues = {}
+    if not any(field.pos is None and field.const for field in plan.names):
+        names = [filled(chunk.iloc[:, field.pos]) for field in plan.names if field.pos is not None]
+        named = pd.Series(False, index=chunk.index)
+        for name in names:
+            named |= name
+        issues["empty_name"] = ~named
+    phone = pd.Series(False, index=chunk.index)
+    email = pd.Series(False, index=chunk.index)
+    for field in plan.props:
+        if field.pos is None or field.kind not in ("tel", "email"):
+            continue  # Generated columns (merged lines, UIDs) are not in the chunk yet
+        col = chunk.iloc[:, field.pos]
+        if field.kind == "tel":
+            phone |= filled(col) & (phonecolumn(col) == "")
+        else:
+            text = col.astype(str).str.strip()
+            email |= filled(col) & ~text.str.match(EMAIL_LIKE)
+    issues["invalid_phone"] = phone
+    issues["invalid_email"] = email
+    return issues
+
+def rownumbers(index):
+    # Spreadsheet line numbers: the header is line 1 and chunk labels count data rows from 0
+    return [int(label) + 2 for label in index]
+
+def iter_validate(chunks, plan, report=None, skip=False, quarantine=None):
+    # quarantine: text file the invalid rows are written to as CSV (implies skip)
+    header = True
+    for chunk in chunks:
+        issues = check(chunk, plan)
+        invalid = pd.Series(False, index=chunk.index)
+        for mask in issues.values():
+            invalid |= mask
+        if report is not None:
+            report["rows"] += len(chunk)
+            report["invalid"] += int(invalid.sum())
+            for issue, mask in issues.items():
+                entry = report["issues"][issue]
+                count = int(mask.sum())
+                entry["count"] += count
+                if count and len(entry["rows"]) < SAMPLE_ROWS:
+                    entry["rows"] += rownumbers(chunk.index[mask][:SAMPLE_ROWS - len(entry["rows"])])
+        if not invalid.any():
+            yield chunk
+            continue
+        if quarantine is not None:
+            bad = chunk[invalid].copy()
+            labels = pd.Series("", index=bad.index)
+            for issue, mask in issues.items():
+                labels = labels.mask(mask[invalid], labels.where(labels == "", labels + ", ") + issue)
+            bad.insert(0, ROW_COLUMN, rownumbers(bad.index))
+            bad[ISSUES_COLUMN] = labels
+            bad.to_csv(quarantine, index=False, header=header)
+            header = False
+        if skip or quarantine is not None:
+            chunk = chunk[~invalid]
+        if len(chunk):
+            yield chunk
+
+def report_csv(report):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["issue", "description", "count", "sample rows"])
+    for issue, entry in report["issues"].items():
+        writer.writerow([issue, ISSUES[issue], entry["count"], " ".join(str(row) for row in entry["rows"])])
+    writer.writerow(["total", f"{report['invalid']} of {report['rows']} rows have at least one issue", report["invalid"], ""])
+    return out.getvalue()
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if path.lower().endswith(".json"):
+            json.dump(report, file, indent=2)
+        else:
+            file.write(report_csv(report))
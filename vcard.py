@@ -1,53 +1,217 @@
-from utils import genphn,genrev,gennote,genorg,genemail,genjob,genaddress,genfullname,genname
+import re
+import pandas as pd
+import perf
+from collections import namedtuple
+from utils import revgen,genrev,genfullname,genname,phonedigits,phonetext,normalize_phones,typeprefix,PHONE_TYPES,EMAIL_TYPES
 
-def gen_vcard(assign,row,version="2.1"):
-    returntext = f"BEGIN:VCARD\nVERSION:{version}\n"
-    name = []
-    suffix = []
-    
+# One compiled entry of an assign mapping: pos is the column position for mapped
+# fields and None for "!" constants, whose final text is pre-rendered in const
+# (spec plans keep the plain value, vcardspec renders it for the requested version).
+Field = namedtuple("Field", ["kind", "param", "pos", "const", "prefix"])
+Plan = namedtuple("Plan", ["names", "suffixes", "props", "country_code", "spec"], defaults=(None, False))
+
+def fieldkind(key):
+    if key.startswith("Phone Number"):
+        return "tel"
+    elif key.startswith("Name"):
+        return "name"
+    elif key.startswith("Suffix"):
+        return "suffix"
+    elif key.startswith("NOTE"):
+        return "note"
+    elif key == "Organization":
+        return "org"
+    elif key.startswith("Email"):
+        return "email"
+    elif key.startswith("Job"):
+        return "title"
+    elif key.startswith("Address"):
+        return "adr"
+    elif key.startswith("UID"):
+        return "uid"
+    elif key.startswith("Photo"):
+        return "photo"  # "TYPE:base64" values, filled in by photo.iter_photos()
+    elif key.startswith("Raw"):
+        return "raw"  # Pre-rendered property lines, e.g. the extra TEL/EMAIL lines of merged contacts
+    return None
+
+def fieldprefix(kind, key):
+    if kind == "tel":
+        param = PHONE_TYPES.get(key)
+        return param, typeprefix("TEL", param)
+    elif kind == "email":
+        param = EMAIL_TYPES.get(key)
+        return param, typeprefix("EMAIL", param)
+    return None, {"note": "NOTE:", "org": "ORG:", "title": "TITLE:", "adr": "ADR:", "uid": "UID:", "raw": ""}.get(kind)
+
+def compile_assign(assign, columns, country_code=None, spec=False):
+    columns = pd.Index(columns)
+    names, suffixes, props = [], [], []
     for key, value in assign.items():
-        key = key[:-1]
+        key = re.sub(r'\d+$', '', key)  # Remove the column number
+        pos = None
+        const = None
         if key.startswith("!"):
-            value = value
             key = key[1:]  # Remove the '!' prefix
+            const = str(value).strip()
+        else:
+            pos = columns.get_loc(value)
+        kind = fieldkind(key)
+        if kind is None or (kind == "photo" and const is not None):
+            continue  # A photo is read from a file named in its column, never a constant
+        param, prefix = fieldprefix(kind, key)
+        field = Field(kind, param, pos, const, prefix)
+        if kind == "name":
+            names.append(field)
+        elif kind == "suffix":
+            suffixes.append(field)
         else:
-            value = row[value]
-        value = str(value).strip()  
-        if key.startswith("Name"):
-            name.append(value)
-        elif key.startswith("Suffix"):
-            suffix.append(value)
+            if const is not None and not spec:
+                field = field._replace(const=genline(field, const, country_code))
+            props.append(field)
+    return Plan(names, suffixes, props, country_code, spec)
+
+def genline(field, value, country_code=None):
+    if field.kind == "tel":
+        return f"{field.prefix}{phonedigits(value, country_code)}\n"
+    if field.kind == "email" or value:
+        return f"{field.prefix}{value}\n"
+    if field.kind == "raw":
+        return ""
+    return "\n"
+
+def rowvalue(row, field):
+    if field.pos is None:
+        return field.const
+    return str(row.iloc[field.pos]).strip()
+
+def gen_vcard(assign,row,version="2.1",rev=None):
+    plan = assign if isinstance(assign, Plan) else compile_assign(assign, row.index)
+    if plan.spec:
+        from vcardspec import speccards
+        return speccards(row.to_frame().T, plan, version, rev).iloc[0]
+    name = [rowvalue(row, field) for field in plan.names]
+    suffix = [rowvalue(row, field) for field in plan.suffixes]
     if not name:
         name = ["Unknown"]
-    returntext += genname(name=name,suffix=suffix)
+    lines = [f"BEGIN:VCARD\nVERSION:{version}\n", genname(name=name,suffix=suffix)]
     name.extend(suffix)
-    returntext += genfullname(name=name)
-    
-    for key, value in assign.items():
-        key = key[:-1]  # Remove the last character which is a number
-        if key.startswith("!"):
-            value = value
-            key = key[1:]
+    lines.append(genfullname(name=name))
+
+    for field in plan.props:
+        if field.pos is None:
+            lines.append(field.const)
+        elif field.kind == "tel":
+            lines.append(genline(field, row.iloc[field.pos], plan.country_code))
+        elif field.kind == "photo":
+            lines.append(photolines(pd.Series([rowvalue(row, field)]), version).iloc[0])
         else:
-            value = row[value]
-        value = str(value).strip()  
-        if key.startswith("Phone Number"):
-            returntext += genphn(key, value)
-        elif key.startswith("Name"):
-            continue
-        elif key.startswith("Suffix"):
-            continue
-        elif key.startswith("NOTE"):
-            returntext += gennote(value)
-        elif key == "Organization":
-            returntext += genorg(value)
-        elif key.startswith("Email"):
-            returntext += genemail(key, value)
-        elif key.startswith("Job"):
-            returntext += genjob(value)
-        elif key.startswith("Address"):
-            returntext += genaddress(value)
-
-    returntext += genrev()
-    returntext += "END:VCARD\n"
-    return returntext
\ No newline at end of file
+            lines.append(genline(field, rowvalue(row, field)))
+
+    lines.append(genrev(rev))
+    lines.append("END:VCARD\n")
+    return "".join(lines)
+
+
+def _textcolumn(col, common=None):
+    if common is not None and common.kind != "O":
+        col = col.astype(common)  # match the upcasting df.iterrows() applies to each row
+    if col.dtype.kind in "iufbO":
+        col = col.astype(str)
+    else:
+        col = col.map(str)
+    return col.str.strip()
+
+def phonecolumn(col, common=None, country_code=None):
+    if common is not None and common.kind != "O":
+        col = col.astype(common)
+    if col.dtype.kind == "f":
+        text = col.astype(str).str.split(".", n=1).str[0]
+    elif col.dtype.kind == "O" and pd.api.types.infer_dtype(col, skipna=True) != "string":
+        text = col.map(phonetext)  # Mixed values, some of them floats
+    else:
+        text = _textcolumn(col, common)
+    return normalize_phones(text, country_code)
+
+def photolines(value, version):
+    # The spec writer's PHOTO lines (ENCODING for the version, base64 folded) with "\n" endings
+    from vcardspec import CRLF, photolines as speclines, versiontable
+    return speclines(versiontable(version)[1], value).str.replace(CRLF, "\n", regex=False)
+
+def _genlines(field, value):
+    line = field.prefix + value + "\n"
+    if field.kind in ("tel", "email"):
+        return line
+    return line.where(value != "", "" if field.kind == "raw" else "\n")
+
+def gen_vcards(df, assign, version="2.1", rev=None):
+    if len(df) == 0:
+        return ""
+    return "".join(gencards(df, assign, version, rev).tolist())
+
+def gencards(df, assign, version="2.1", rev=None):
+    # One card string per row, indexed like df
+    if len(df) == 0:
+        return pd.Series([], index=df.index, dtype=object)
+    plan = assign if isinstance(assign, Plan) else compile_assign(assign, df.columns)
+    if plan.spec:
+        from vcardspec import speccards
+        return speccards(df, plan, version, rev)
+    common = df.iloc[:0].to_numpy().dtype
+
+    def values(fields):
+        return [field.const if field.pos is None else _textcolumn(df.iloc[:, field.pos], common) for field in fields]
+
+    with perf.stage("generate.names"):
+        name = values(plan.names)
+        suffix = values(plan.suffixes)
+        if not name:
+            name = ["Unknown"]
+
+        n = name[0]
+        for value in name[1:]:
+            n = n + " " + value
+        if isinstance(n, str):
+            n = n.strip()
+        else:
+            n = n.str.strip()
+        n = n + ";;;;"
+        for i, value in enumerate(suffix):
+            n = n + (" " if i else "") + value
+
+        fn = pd.Series("", index=df.index)
+        for value in name + suffix:
+            if isinstance(value, str):
+                if value:
+                    fn = fn + " " + value
+            else:
+                fn = fn.mask(value != "", fn + " " + value)
+        fn = fn.str[1:].mask(fn == "", "Unknown")
+
+    out = f"BEGIN:VCARD\nVERSION:{version}\n" + ("N:" + n + "\n") + ("FN:" + fn + "\n")
+    for field in plan.props:
+        with perf.stage("generate.field." + field.kind):
+            if field.pos is None:
+                out = out + field.const
+            elif field.kind == "tel":
+                out = out + _genlines(field, phonecolumn(df.iloc[:, field.pos], common, plan.country_code))
+            elif field.kind == "photo":
+                out = out + photolines(_textcolumn(df.iloc[:, field.pos], common), version)
+            else:
+                out = out + _genlines(field, _textcolumn(df.iloc[:, field.pos], common))
+
+    perf.count("rows.generated", len(df))
+    return out + genrev(rev) + "END:VCARD\n"
+
+def iter_vcards(df, assign, version="2.1", batch=10000, rev=None):
+    plan = assign if isinstance(assign, Plan) else compile_assign(assign, df.columns)
+    rev = rev or revgen()
+    for start in range(0, len(df), batch):
+        yield gen_vcards(df.iloc[start:start + batch], plan, version, rev).encode("utf-8")
+
+def write_vcards(fp, df, assign, version="2.1", batch=10000, rev=None):
+    size = 0
+    for chunk in iter_vcards(df, assign, version, batch, rev):
+        fp.write(chunk)
+        size += len(chunk)
+    return size
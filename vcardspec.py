@@ -0,0 +1,217 @@
+import re
+import binascii
+import pandas as pd
+import perf
+from vcard import phonecolumn, _textcolumn
+from utils import phonedigits, revgen
+
+# Standards-compliant serializer for vCard 2.1 (vCard spec 2.1), 3.0 (RFC 2426) and
+# 4.0 (RFC 6350), used when a plan is compiled with spec=True. Everything that differs
+# between versions lives in VERSIONS. Each column is escaped as one joined string
+# (a few C-level replaces, no per-value Python) and only lines that need it go through
+# Python: folding at 75 octets for 3.0/4.0, and quoted-printable for 2.1 values with
+# non-ASCII characters, line breaks or more than 75 octets (2.1 folding is not
+# lossless, quoted-printable soft breaks are). Lines end in CRLF, empty properties
+# are left out, N and ADR are structured.
+
+CRLF = "\r\n"
+# Escapes as (old, new) replacements, applied in order, backslash first
+ESCAPE_TEXT = (("\\", "\\\\"), (";", "\\;"), (",", "\\,"), ("\r\n", "\\n"), ("\n", "\\n"), ("\r", "\\n"))
+ESCAPE_21_TEXT = (("\r\n", "\n"), ("\r", "\n"))  # Line breaks are kept and quoted-printable encoded
+ESCAPE_21_COMPONENT = (("\\", "\\\\"), (";", "\\;"), ("\r\n", "\n"), ("\r", "\n"))
+
+VERSIONS = {
+    "2.1": {"text": ESCAPE_21_TEXT, "component": ESCAPE_21_COMPONENT, "bare_types": True, "lower_types": False, "internet": True, "qp": True, "uid": "", "photo": "BASE64"},
+    "3.0": {"text": ESCAPE_TEXT, "component": ESCAPE_TEXT, "bare_types": False, "lower_types": False, "internet": True, "qp": False, "uid": "", "photo": "b"},
+    "4.0": {"text": ESCAPE_TEXT, "component": ESCAPE_TEXT, "bare_types": False, "lower_types": True, "internet": False, "qp": False, "uid": "urn:uuid:", "photo": None},
+}
+VERSION_TYPES = {"4.0": {"CELL", "WORK", "HOME"}}  # TYPE values 4.0 defines for TEL and EMAIL
+NAMES = {"note": "NOTE", "org": "ORG", "title": "TITLE", "adr": "ADR", "uid": "UID", "tel": "TEL", "email": "EMAIL"}
+NEEDS_QP = re.compile(r"[^\x20-\x7e]")
+QP_HEADER = ";CHARSET=UTF-8;ENCODING=QUOTED-PRINTABLE"
+
+def versiontable(version):
+    version = str(version)
+    if version not in VERSIONS:
+        raise ValueError(f"Unsupported vCard version: {version}")
+    return version, VERSIONS[version]
+
+def escape(text, table):
+    for old, new in table:
+        text = text.replace(old, new)
+    return text
+
+def translate(values, table):
+    # The whole column is escaped at once: joined on NUL, replaced in C, split again
+    parts = escape("\x00".join(values.tolist()), table).split("\x00")
+    if len(parts) != len(values):
+        return values.map(lambda value: escape(value, table))  # A value held a NUL (or the column is empty)
+    return pd.Series(parts, index=values.index)
+
+def anymatch(values, pattern):
+    # Per-value matches, skipped when one search over the whole column finds nothing
+    if not pattern.search("\x20".join(values.tolist())):
+        return pd.Series(False, index=values.index)
+    return values.str.contains(pattern)
+
+def typeparams(version, table, types):
+    allowed = VERSION_TYPES.get(version)
+    types = [typ for typ in types if typ and (allowed is None or typ in allowed)]
+    if table["lower_types"]:
+        types = [typ.lower() for typ in types]
+    if not types:
+        return ""
+    if table["bare_types"]:
+        return "".join(";" + typ for typ in types)  # 2.1: TEL;CELL
+    return ";TYPE=" + ",".join(types)
+
+def fold(line):
+    # Split after at most 75 octets (74 after the leading space), never inside a UTF-8 sequence
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+    parts = []
+    start, limit = 0, 75
+    while len(data) - start > limit:
+        end = start + limit
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start, limit = end, 74
+    parts.append(data[start:].decode("utf-8"))
+    return (CRLF + " ").join(parts)
+
+QP_TOKEN = re.compile(r"=[0-9A-F]{2}|.", re.S)
+QP_LEADING = {" ": "=20", "\t": "=09"}
+
+def quoted(value, used):
+    # Quoted-printable with CRLF soft breaks, at most 76 octets a line; `used` characters
+    # of the first line are taken by the property name. The lines are wrapped here, not
+    # by b2a_qp, so a space or tab that would start a line after a soft break is encoded:
+    # left literal, readers that unfold before decoding take the line for a folded one.
+    data = value.replace("\r\n", "\n").replace("\n", "\r\n").encode("utf-8")
+    encoded = re.sub(r"=\r?\n", "", binascii.b2a_qp(data, istext=False).decode("ascii"))  # Its own soft breaks
+    lines = []
+    line, width = "", used
+    for token in QP_TOKEN.findall(encoded):
+        if width + len(token) > 75:
+            lines.append(line)
+            line, width = "", 0
+        if not line and lines:
+            token = QP_LEADING.get(token, token)
+        line += token
+        width += len(token)
+    lines.append(line)
+    return ("=" + CRLF).join(lines)
+
+def encodelines(table, head, value):
+    # head: property name with parameters; value: escaped (and assembled) value
+    line = head + ":" + value
+    if table["qp"]:
+        special = anymatch(value, NEEDS_QP) | (line.str.len() > 75)
+        if special.any():
+            used = len(head) + len(QP_HEADER) + 1
+            encoded = pd.Series([quoted(text, used) for text in value[special]], index=value[special].index)
+            line = line.mask(special, head + QP_HEADER + ":" + encoded)
+        return line + CRLF
+    length = line.str.len()
+    long = length > 75
+    if not "".join(line.tolist()).isascii():
+        long |= (length > 18) & ~line.map(str.isascii)  # Up to 4 octets per character
+    if long.any():
+        line = line.mask(long, line[long].map(fold))
+    return line + CRLF
+
+def joinnonempty(values, sep, index):
+    out = pd.Series("", index=index)
+    for value in values:
+        out = out.mask(value != "", out.where(out == "", out + sep) + value)
+    return out
+
+def column(df, field, common):
+    # Text of a mapped column with missing cells empty (the legacy writer prints "nan")
+    if field.pos is None:
+        return pd.Series(field.const, index=df.index)
+    col = df.iloc[:, field.pos]
+    return _textcolumn(col, common).where(col.notna(), "")
+
+def photolines(table, value):
+    # value: "TYPE:base64"; 4.0 has a data: URI, 2.1 ends a base64 value with a blank line
+    parts = value.str.partition(":")
+    if table["photo"] is None:
+        line = "PHOTO:data:image/" + parts[0].str.lower() + ";base64," + parts[2]
+    else:
+        line = f"PHOTO;ENCODING={table['photo']};TYPE=" + parts[0] + ":" + parts[2]
+    line = line.map(fold) + CRLF
+    if table["qp"]:
+        line = line + CRLF
+    return line.where(value != "", "")
+
+def proplines(version, table, field, value):
+    # Lines for one field, "" where the value is empty; tel values are raw numbers
+    if field.kind == "raw":
+        return (value + CRLF).where(value != "", "")
+    if field.kind == "photo":
+        return photolines(table, value)
+    if field.kind == "tel":
+        head = "TEL" + typeparams(version, table, [field.param])
+        text = value
+    elif field.kind == "email":
+        head = "EMAIL" + typeparams(version, table, ["INTERNET" if table["internet"] else None, field.param])
+        text = translate(value, table["text"])
+    elif field.kind == "adr":
+        head = "ADR"
+        text = ";;" + translate(value, table["component"]) + ";;;;"  # Whole address as the street
+    elif field.kind == "org":
+        head = "ORG"
+        text = translate(value, table["component"])
+    elif field.kind == "uid":
+        head = "UID"
+        text = table["uid"] + value
+    else:
+        head = NAMES[field.kind]
+        text = translate(value, table["text"])
+    return encodelines(table, head, text).where(value != "", "")
+
+def speccards(df, plan, version="3.0", rev=None):
+    version, table = versiontable(version)
+    common = df.iloc[:0].to_numpy().dtype
+    index = df.index
+    with perf.stage("generate.names"):
+        names = [column(df, field, common) for field in plan.names]
+        suffixes = [column(df, field, common) for field in plan.suffixes]
+
+        # N: several name columns are given, middle and family names; a single one is
+        # split at its last space
+        if len(names) > 1:
+            given, family = names[0], names[-1]
+            middle = joinnonempty(names[1:-1], " ", index)
+        elif names:
+            parts = names[0].str.split().str.join(" ").str.rsplit(" ", n=1)
+            given = parts.str[0].fillna("")
+            family = parts.str[1].fillna("")
+            middle = pd.Series("", index=index)
+        else:
+            given = family = middle = pd.Series("", index=index)
+        fn = joinnonempty(names + suffixes, " ", index).str.strip()
+        given = given.mask((fn == "") & (family == ""), "Unknown")
+        fn = fn.mask(fn == "", "Unknown")
+        component = table["component"]
+        suffix = joinnonempty([translate(value, component) for value in suffixes], ",", index)
+        n = translate(family, component) + ";" + translate(given, component) + ";" + translate(middle, component) + ";;" + suffix
+
+    out = f"BEGIN:VCARD{CRLF}VERSION:{version}{CRLF}" + encodelines(table, "N", n) + encodelines(table, "FN", translate(fn, table["text"]))
+    for field in plan.props:
+        with perf.stage("generate.field." + field.kind):
+            if field.pos is None:
+                if field.kind == "tel":
+                    value = pd.Series([phonedigits(field.const, plan.country_code)])
+                else:
+                    value = pd.Series([field.const])
+                out = out + proplines(version, table, field, value).iloc[0]
+            elif field.kind == "tel":
+                out = out + proplines(version, table, field, phonecolumn(df.iloc[:, field.pos], common, plan.country_code))
+            else:
+                out = out + proplines(version, table, field, column(df, field, common))
+    perf.count("rows.generated", len(df))
+    return out + f"REV:{rev or revgen()}{CRLF}END:VCARD{CRLF}"
@@ -0,0 +1,177 @@
+import csv
+import quopri
+
+# Spreadsheet columns written for each card. They mirror the fields gen_vcard emits
+# and are named so columncheck() maps them straight back when the sheet is re-uploaded.
+COLUMNS = ["Name", "Suffix", "Mobile", "Work Phone", "Home Phone", "Phone", "Email Work", "Email Home", "Email Other", "Email", "Organization", "Job Title", "Address", "Note"]
+PHONE_COLUMNS = {"CELL": "Mobile", "MOBILE": "Mobile", "WORK": "Work Phone", "HOME": "Home Phone"}
+EMAIL_COLUMNS = {"WORK": "Email Work", "HOME": "Email Home", "OTHER": "Email Other"}
+SIMPLE_COLUMNS = {"TITLE": "Job Title", "NOTE": "Note"}
+BARE_ENCODINGS = {"QUOTED-PRINTABLE", "BASE64", "8BIT", "7BIT"}  # vCard 2.1 ENCODING values written without ENCODING=
+ESCAPES = {"n": "\n", "N": "\n", ",": ",", ";": ";", "\\": "\\", ":": ":"}
+
+def decodeline(raw):
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+def isqp(line):
+    head = line.split(":", 1)[0].upper()
+    return "QUOTED-PRINTABLE" in head
+
+def iter_lines(fp):
+    # Yields logical content lines: folded lines are joined, and quoted-printable
+    # soft line breaks ("=" at the end of a line) are joined with the next line
+    current = None
+    for raw in fp:
+        if isinstance(raw, bytes):
+            raw = decodeline(raw)
+        line = raw.rstrip("\r\n")
+        if current is not None and current.endswith("=") and isqp(current):
+            current = current[:-1] + line  # Before fold detection: the next line may start with a space
+            continue
+        if current is not None and line[:1] in (" ", "\t"):
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+def splitparams(head):
+    parts = []
+    part = []
+    quoted = False
+    for char in head:
+        if char == '"':
+            quoted = not quoted
+        elif char == ";" and not quoted:
+            parts.append("".join(part))
+            part = []
+            continue
+        part.append(char)
+    parts.append("".join(part))
+    return parts
+
+def parseline(line):
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            break
+    else:
+        return None
+    head, value = line[:i], line[i + 1:]
+    parts = splitparams(head)
+    name = parts[0].rsplit(".", 1)[-1].upper()  # Drop "item1." style groups
+    params = {}
+    for param in parts[1:]:
+        key, sep, values = param.partition("=")
+        if not sep:
+            # vCard 2.1 bare parameters: an encoding (NOTE;QUOTED-PRINTABLE) or a type (TEL;CELL)
+            key, values = ("ENCODING" if key.upper() in BARE_ENCODINGS else "TYPE"), key
+        for item in values.split(","):
+            params.setdefault(key.upper(), []).append(item.strip('"').upper())
+    return name, params, value
+
+def decodevalue(params, value):
+    if "QUOTED-PRINTABLE" in params.get("ENCODING", []):
+        charset = (params.get("CHARSET") or ["UTF-8"])[0]
+        return quopri.decodestring(value.encode("latin-1", "replace")).decode(charset, "replace")
+    return value
+
+def splitvalue(value, sep=";"):
+    # Splits on unescaped separators and removes backslash escapes
+    parts = []
+    part = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            part.append(ESCAPES.get(char, "\\" + char))
+        elif char == sep:
+            parts.append("".join(part))
+            part = []
+        else:
+            part.append(char)
+    parts.append("".join(part))
+    return parts
+
+def unescape(value):
+    return splitvalue(value, None)[0]
+
+def addvalue(record, column, value):
+    value = value.strip()
+    if not value:
+        return
+    if record.get(column):
+        record[column] += "; " + value
+    else:
+        record[column] = value
+
+def iter_records(fp):
+    record = None
+    fullname = ""
+    for line in iter_lines(fp):
+        parsed = parseline(line)
+        if parsed is None:
+            continue
+        name, params, value = parsed
+        if name == "BEGIN" and value.strip().upper() == "VCARD":
+            record = dict.fromkeys(COLUMNS, "")
+            fullname = ""
+            continue
+        if record is None:
+            continue
+        if name == "END":
+            if not record["Name"] and fullname != "Unknown":
+                record["Name"] = fullname
+            yield record
+            record = None
+            continue
+        value = decodevalue(params, value)
+        types = params.get("TYPE", [])
+        if name == "N":
+            family, given, middle, prefix, suffix = (splitvalue(value) + [""] * 5)[:5]
+            record["Name"] = " ".join(part.strip() for part in (prefix, given, middle, family) if part.strip())
+            if record["Name"] == "Unknown":
+                record["Name"] = ""
+            addvalue(record, "Suffix", suffix)
+        elif name == "FN":
+            fullname = unescape(value).strip()
+        elif name == "TEL":
+            column = next((PHONE_COLUMNS[typ] for typ in types if typ in PHONE_COLUMNS), "Phone")
+            addvalue(record, column, unescape(value))
+        elif name == "EMAIL":
+            column = next((EMAIL_COLUMNS[typ] for typ in types if typ in EMAIL_COLUMNS), "Email")
+            addvalue(record, column, unescape(value))
+        elif name == "ORG":
+            addvalue(record, "Organization", ", ".join(part.strip() for part in splitvalue(value) if part.strip()))
+        elif name == "ADR":
+            addvalue(record, "Address", ", ".join(part.strip() for part in splitvalue(value) if part.strip()))
+        elif name in SIMPLE_COLUMNS:
+            addvalue(record, SIMPLE_COLUMNS[name], unescape(value))
+
+def write_csv(records, fp, sep=","):
+    writer = csv.DictWriter(fp, fieldnames=COLUMNS, delimiter=sep)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+def write_xlsx(records, fp):
+    from openpyxl import Workbook
+    book = Workbook(write_only=True)  # Rows are streamed to disk as they are appended
+    sheet = book.create_sheet("Contacts")
+    sheet.append(COLUMNS)
+    count = 0
+    for record in records:
+        sheet.append([record[column] for column in COLUMNS])
+        count += 1
+    book.save(fp)
+    return count